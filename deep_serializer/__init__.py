@@ -17,5 +17,6 @@
 
 from deep_serializer.api import (BaseMetaWalkClass, WALKING_STOP,
                                 ONLY_REFERENCE, WALKING_INTO_CLASS)
-from deep_serializer.base import get_serializer, get_deserializer, serializer, deserializer
+from deep_serializer.base import get_serializer, get_deserializer, serializer, serializer_many, deserializer
+from deep_serializer.plan import compile_walk_plan, WalkPlan
 from deep_serializer.utils import has_natural_key
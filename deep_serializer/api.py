@@ -21,13 +21,47 @@
 # For reverse relations only you can use WALKING_INTO_CLASS and ONLY_REFERENCE.
 
 
+from deep_serializer.exceptions import update_the_serializer
+
 WALKING_STOP = 1
 ONLY_REFERENCE = 2
 WALKING_INTO_CLASS = 3
 
+_walking_rules = {}
+
 
 class BaseMetaWalkClass(object):
 
+    # If walking_into_class only depends on the field_name and the model
+    # (not on initial_obj, obj or request) set it to True. Then a walk plan
+    # (deep_serializer.compile_walk_plan) calls it once per relation.
+    static_walking = False
+
+    # Declarative form of walking_into_class, a dictionary from the relation name
+    # (or a tuple of relation names) to the walking status, e.g.:
+    # walking_rules = {('initial_page', 'websites_created_of'): WALKING_STOP,
+    #                  'page': WALKING_INTO_CLASS}
+    # The relations without rule are asked to walking_into_class
+    walking_rules = None
+
+    @classmethod
+    def get_walking_rules(cls):
+        """
+            Return the walking_rules as a lookup table: relation name -> walking status.
+            This is calculated once per class.
+        """
+        try:
+            return _walking_rules[cls]
+        except KeyError:
+            rules = {}
+            for field_names, walking_status in (cls.walking_rules or {}).items():
+                if not isinstance(field_names, (tuple, list)):
+                    field_names = (field_names, )
+                for field_name in field_names:
+                    rules[field_name] = walking_status
+            _walking_rules[cls] = rules
+            return rules
+
     @classmethod
     def pre_serialize(cls, initial_obj, obj, request=None, serialize_options=None):
         """
@@ -37,13 +71,29 @@ class BaseMetaWalkClass(object):
         """
         return obj
 
+    @classmethod
+    def pre_serialize_batch(cls, initial_obj, objs, request=None, serialize_options=None):
+        """
+            Batch form of pre_serialize, given a list of objects of the same model
+            return the list of objects to serialize (in the same order).
+            If you implement it, it is called instead of pre_serialize once per
+            model (and per DEEP_SERIALIZER_BATCH_SIZE objects)
+        """
+        return [cls.pre_serialize(initial_obj, obj, request, serialize_options) for obj in objs]
+
     @classmethod
     def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
         """
             Given the the current object, the relation name and the model to the relation,
             You can determine if to walk into this model or not.
             This funcion is used at the serialization process.
+            If the class has walking_rules, the relations without rule raise an exception
         """
+        if cls.walking_rules is not None:
+            walking_status = cls.get_walking_rules().get(field_name, None)
+            if walking_status is None:
+                update_the_serializer(obj, field_name)
+            return walking_status
         return WALKING_INTO_CLASS
 
     @classmethod
@@ -83,3 +133,20 @@ class BaseMetaWalkClass(object):
             This funcion is used at the deserialization process.
         """
         pass
+
+    @classmethod
+    def post_save_batch(cls, initial_obj, objs, request=None):
+        """
+            Batch form of post_save, given a list of saved objects of the same model.
+            If you implement it, it is called instead of post_save once per model,
+            when all the objects are saved.
+        """
+        for obj in objs:
+            cls.post_save(initial_obj, obj, request=request)
+
+    @classmethod
+    def has_batch_hook(cls, hook_name):
+        """
+            Return if the class implements the batch hook (pre_serialize_batch or post_save_batch)
+        """
+        return getattr(cls, hook_name).__func__ is not getattr(BaseMetaWalkClass, hook_name).__func__
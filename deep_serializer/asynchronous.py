@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 by Pablo Martín <goinnn@gmail.com>
+#
+# This software is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+try:
+    from django.db import close_old_connections
+except ImportError:  # Django < 1.6
+    from django.db import close_connection as close_old_connections
+
+from deep_serializer.base import serializer, deserializer
+from deep_serializer.settings import ASYNC_WORKERS
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+        The executor shared by the asynchronous serializations,
+        with DEEP_SERIALIZER_ASYNC_WORKERS threads
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS)
+    return _executor
+
+
+def aserializer(format, *args, **kwargs):
+    """
+        Return an asyncio future (it can be awaited in the loop, by default the event
+        loop of the caller) with the result of serializer(format, ...). The serialization
+        runs in an executor (executor, by default get_executor()). If the future is
+        cancelled the serialization stops before the next object, and it sets the
+        cancelled event if one is given.
+    """
+    return run_in_executor(serializer, format, args, kwargs)
+
+
+def adeserializer(format, *args, **kwargs):
+    """
+        Return an asyncio future with the result of deserializer(format, ...).
+        If the future is cancelled the deserialization stops before to save the
+        next object and its transaction is rolled back.
+    """
+    return run_in_executor(deserializer, format, args, kwargs)
+
+
+def run_in_executor(function, format, args, kwargs):
+    if asyncio is None or ThreadPoolExecutor is None:
+        raise ImproperlyConfigured('The asynchronous serialization needs asyncio and concurrent.futures')
+    executor = kwargs.pop('executor', None) or get_executor()
+    loop = kwargs.pop('loop', None) or asyncio.get_event_loop()
+    cancelled = kwargs.get('cancelled', None)
+    if cancelled is None:
+        cancelled = kwargs['cancelled'] = threading.Event()
+
+    def run():
+        # Like a request, the thread reuses its connection if it is usable
+        close_old_connections()
+        try:
+            return function(format, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+    def cancel(future):
+        if future.cancelled():
+            cancelled.set()
+    # An asyncio future of the loop, not the future of the executor
+    future = asyncio.wrap_future(executor.submit(run), loop=loop)
+    future.add_done_callback(cancel)
+    return future
@@ -14,26 +14,39 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this software.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import copy
+import functools
+import itertools
 import logging
+import operator
 import sys
 
 from django.conf import settings
 from django.core import serializers
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import connections, models
 from django.db import transaction
+from django.db.models.query import prefetch_related_objects
 from django.utils import importlib
+from django.utils import six
 
-from deep_serializer.settings import USE_INTERNAL_SERIALIZERS
+from deep_serializer.settings import USE_INTERNAL_SERIALIZERS, BATCH_SIZE
 
 if USE_INTERNAL_SERIALIZERS:
     from deep_serializer.serializers.base import DeserializationError
 else:
     from django.core.serializers.base import DeserializationError
+from deep_serializer.serializers.base import Serializer as InternalSerializer
 
 from deep_serializer.api import BaseMetaWalkClass, WALKING_INTO_CLASS, WALKING_STOP
-from deep_serializer.exceptions import DoesNotNaturalKeyException, DeepSerializerDoesNotExist
-from deep_serializer.utils import has_natural_key
+from deep_serializer.dependencies import sort_by_dependencies, get_natural_key_references, get_natural_keys
+from deep_serializer.exceptions import (DoesNotNaturalKeyException, DeepSerializerDoesNotExist,
+                                        SerializationCancelled)
+from deep_serializer.plan import WalkPlan
+from deep_serializer.utils import (has_natural_key, get_content_key, get_model_relations, get_model_label,
+                                   chunked, get_num_bytes, get_max_query_params, IdentityMap, ObjectKey, SavedObjects,
+                                   SerializationBudget, BudgetStream)
 
 PY3 = sys.version_info[0] == 3
 
@@ -78,62 +91,190 @@ class Serializer(BaseMetaWalkClassProvider):
                            walking_classes, walking_always=False, request=None):
         if walking_always:
             return WALKING_INTO_CLASS
-        elif model in walking_classes:
+        if isinstance(walking_classes, WalkPlan):
+            walking_status = walking_classes.get_walking_status(obj.__class__, field_name)
+            if walking_status is not None:
+                return walking_status
+        if model in walking_classes:
             meta_class = cls.get_meta_walking_class(obj, walking_classes)
+            walking_status = meta_class.get_walking_rules().get(field_name, None)
+            if walking_status is not None:
+                return walking_status
             return meta_class.walking_into_class(initial_obj, obj, field_name, model, request=request)
         else:
             return WALKING_STOP
 
     @classmethod
-    def serialize_fk(cls, initial_obj, obj, object_list,
+    def select_natural_key_relations(cls, queryset, exclude=None):
+        """
+            Load with the queryset the foreign keys used by the natural keys of its
+            model (natural_key.dependencies), except the exclude relation (the parent)
+        """
+        field_names = [field_name for field_name in get_model_relations(queryset.model).natural_key_fields
+                       if field_name != exclude]
+        if field_names:
+            queryset = queryset.select_related(*field_names)
+        return queryset
+
+    @classmethod
+    def cache_natural_key(cls, content, identity_map=None):
+        """
+            Save the natural key of a walked object before it is changed by the
+            hooks. The serializers use it for the references to this object.
+        """
+        if identity_map is not None:
+            identity_map.add_natural_key(content)
+
+    @classmethod
+    def get_fk_references(cls, obj, contents):
+        """
+            Return the ids of the contents related with obj by a foreign key, these are
+            the objects cached in obj that the serializers use for its references
+        """
+        contents_ids = set(id(content) for content in contents)
+        references = []
+        for field in get_model_relations(obj.__class__).fks:
+            related = getattr(obj, field.get_cache_name(), None)
+            if related is not None and id(related) in contents_ids:
+                references.append(id(related))
+        return references
+
+    @classmethod
+    def references_waiting(cls, obj, waiting):
+        """
+            Return if obj references by a foreign key an object of waiting (ids)
+        """
+        if not waiting:
+            return False
+        for field in get_model_relations(obj.__class__).fks:
+            related = getattr(obj, field.get_cache_name(), None)
+            if related is not None and id(related) in waiting:
+                return True
+        return False
+
+    @classmethod
+    def use_internal_serializer(cls):
+        return issubclass(serializers.get_serializer(cls.format), InternalSerializer)
+
+    @classmethod
+    def serialize_fk(cls, initial_obj, obj,
                      walking_classes=None,
                      walking_always=True,
-                     natural_keys=True,
-                     several_path=False,
                      request=None):
-        model = obj.__class__
-        for field in model._meta.fields:
-            if hasattr(field.rel, 'to'):
+        """
+            Yield the objects related with obj by a foreign key (or one2one) to walk into
+        """
+        for field in get_model_relations(obj.__class__).fks:
+            walking_status = cls.walking_into_class(initial_obj,
+                                                    obj, field.name,
+                                                    field.rel.to,
+                                                    walking_classes,
+                                                    walking_always,
+                                                    request=request)
+
+            if walking_status == WALKING_STOP:
+                cls.stop_fk(obj, field)
+
+            if walking_status != WALKING_INTO_CLASS:
+                continue
+            content = getattr(obj, field.name)
+            if content:
+                yield content
+
+    @classmethod
+    def stop_fk(cls, obj, field):
+        """
+            Remove the relation of obj by a foreign key. Only obj is changed, not the
+            field, it is shared by all the serializations (and threads)
+        """
+        setattr(obj, field.attname, None)
+        setattr(obj, field.get_cache_name(), None)
+
+    @classmethod
+    def serialize_fk_batch(cls, initial_obj, objs,
+                           walking_classes=None,
+                           walking_always=True,
+                           request=None,
+                           visited=None):
+        """
+            Given a list of objects, return for each one the list of objects related by a
+            foreign key (or one2one) to walk into. The related objects are loaded with
+            one query per related model, the objects of visited are not loaded.
+        """
+        pending = {}
+        objs_related = []
+        for obj in objs:
+            obj_related = []
+            for field in get_model_relations(obj.__class__).fks:
                 walking_status = cls.walking_into_class(initial_obj,
                                                         obj, field.name,
                                                         field.rel.to,
                                                         walking_classes,
                                                         walking_always,
                                                         request=request)
-
                 if walking_status == WALKING_STOP:
-                    field_null = field.null
-                    field_blank = field.blank
-                    field.null = True
-                    field.blank = True
-                    setattr(obj, field.name, None)
-                    field.null = field_null
-                    field.blank = field_blank
+                    cls.stop_fk(obj, field)
 
                 if walking_status != WALKING_INTO_CLASS:
                     continue
-                content = getattr(obj, field.name)
-                if content and not content in object_list:
-                    cls.objects_to_serialize(initial_obj, content, object_list,
-                                             walking_classes=walking_classes,
-                                             walking_always=walking_always,
-                                             natural_keys=natural_keys,
-                                             several_path=several_path,
-                                             request=request)
-                elif content and several_path:
-                    cls.add_content(object_list, content,
-                                    natural_keys=natural_keys,
-                                    request=request)
+                cache_name = field.get_cache_name()
+                if hasattr(obj, cache_name):
+                    content = getattr(obj, cache_name)
+                    if content:
+                        obj_related.append(content)
+                    continue
+                value = getattr(obj, field.attname)
+                if value is None:
+                    continue
+                model = field.rel.to
+                if (visited is not None and field.rel.field_name == model._meta.pk.name and
+                        (model, value) in visited):
+                    continue
+                related_key = (model, field.rel.field_name)
+                pending.setdefault(related_key, set()).add(value)
+                obj_related.append((field, related_key, value))
+            objs_related.append(obj_related)
+
+        loaded = {}
+        for (model, field_name), values in pending.items():
+            for values_chunk in chunked(list(values), BATCH_SIZE):
+                queryset = model._base_manager.filter(**{'%s__in' % field_name: values_chunk})
+                queryset = cls.select_natural_key_relations(queryset)
+                for content in queryset:
+                    loaded[(model, field_name, getattr(content, field_name))] = content
+
+        contents = []
+        used = set()
+        for obj, obj_related in zip(objs, objs_related):
+            obj_contents = []
+            for related in obj_related:
+                if isinstance(related, models.Model):
+                    obj_contents.append(related)
+                    continue
+                field, (model, field_name), value = related
+                content = loaded.get((model, field_name, value), None)
+                if content is None:
+                    continue
+                if id(content) in used:
+                    # Every relation has its own object (as getattr does), the
+                    # hooks could change the object of other relation
+                    content = copy.copy(content)
+                used.add(id(content))
+                setattr(obj, field.get_cache_name(), content)
+                obj_contents.append(content)
+            contents.append(obj_contents)
+        return contents
 
     @classmethod
-    def serialize_m2m(cls, initial_obj, obj, object_list,
+    def serialize_m2m(cls, initial_obj, obj,
                       walking_classes=None,
                       walking_always=True,
-                      natural_keys=True,
-                      several_path=False,
-                      request=None):
-        model = obj.__class__
-        for field in model._meta.many_to_many:
+                      request=None,
+                      read_only=False):
+        """
+            Yield the objects related with obj by a many to many relation to walk into
+        """
+        for field in get_model_relations(obj.__class__).m2ms:
             walking_status = cls.walking_into_class(initial_obj,
                                                     obj,
                                                     field.name,
@@ -142,74 +283,386 @@ class Serializer(BaseMetaWalkClassProvider):
                                                     walking_always,
                                                     request=request)
             if walking_status == WALKING_STOP:
-                getattr(obj, field.name).clear()
+                cls.stop_m2m(obj, field, read_only=read_only)
 
             if walking_status != WALKING_INTO_CLASS:
                 continue
             meta_class = cls.get_meta_walking_class(obj, walking_classes)
+            # Prefetched, the serializers use these objects instead of querying again
+            prefetch_related_objects([obj], [field.name])
             contents = getattr(obj, field.name).all()
             contents = meta_class.get_queryset_to_relation(initial_obj, obj, field.name, contents, request=request)
             for content in contents:
-                if content and not content in object_list:
-                    cls.objects_to_serialize(initial_obj, content, object_list,
-                                             walking_classes=walking_classes,
-                                             walking_always=walking_always,
-                                             natural_keys=natural_keys,
-                                             several_path=several_path,
-                                             request=request)
-                elif content and several_path:
-                    cls.add_content(object_list, content,
-                                    natural_keys=natural_keys,
-                                    request=request)
+                if content:
+                    # A copy, the hooks must not change the prefetched objects (the references)
+                    yield copy.copy(content)
+
+    @classmethod
+    def stop_m2m(cls, obj, field, read_only=False):
+        """
+            Empty a many to many relation of obj. In read only mode the relation is not
+            cleared in the database, an empty queryset is set like a prefetched relation
+            and the serializers use it.
+        """
+        if read_only:
+            if not hasattr(obj, '_prefetched_objects_cache'):
+                obj._prefetched_objects_cache = {}
+            obj._prefetched_objects_cache[field.name] = field.rel.to._default_manager.none()
+        else:
+            getattr(obj, field.name).clear()
 
     @classmethod
-    def serialize_reverse(cls, initial_obj, obj, object_list,
+    def serialize_m2m_batch(cls, initial_obj, objs,
+                            walking_classes=None,
+                            walking_always=True,
+                            request=None,
+                            read_only=False):
+        """
+            Given a list of objects, return for each one the list of objects related by a
+            many to many relation to walk into. Every relation is prefetched with one query
+            for all the objects, these prefetched objects are used by the internal serializers too.
+        """
+        to_prefetch = {}
+        objs_fields = []
+        for obj in objs:
+            obj_fields = []
+            for field in get_model_relations(obj.__class__).m2ms:
+                walking_status = cls.walking_into_class(initial_obj,
+                                                        obj,
+                                                        field.name,
+                                                        field.rel.to,
+                                                        walking_classes,
+                                                        walking_always,
+                                                        request=request)
+                if walking_status == WALKING_STOP:
+                    cls.stop_m2m(obj, field, read_only=read_only)
+                    continue
+                # The internal serializers use the prefetched objects of the references too
+                if walking_status == WALKING_INTO_CLASS or USE_INTERNAL_SERIALIZERS:
+                    to_prefetch.setdefault((obj.__class__, field.name), []).append(obj)
+                if walking_status == WALKING_INTO_CLASS:
+                    obj_fields.append(field)
+            objs_fields.append(obj_fields)
+
+        for (model, field_name), model_objs in to_prefetch.items():
+            for objs_chunk in chunked(model_objs, BATCH_SIZE):
+                prefetch_related_objects(objs_chunk, [field_name])
+
+        contents = []
+        for obj, obj_fields in zip(objs, objs_fields):
+            obj_contents = []
+            if obj_fields:
+                meta_class = cls.get_meta_walking_class(obj, walking_classes)
+            for field in obj_fields:
+                # Without filters this is the prefetched queryset, so it does not query
+                field_contents = getattr(obj, field.name).all()
+                field_contents = meta_class.get_queryset_to_relation(initial_obj, obj, field.name,
+                                                                     field_contents, request=request)
+                # Copies, the hooks must not change the prefetched objects (the references)
+                obj_contents.extend(copy.copy(content) for content in field_contents if content)
+            contents.append(obj_contents)
+        return contents
+
+    @classmethod
+    def serialize_reverse(cls, initial_obj, obj,
                           walking_classes=None,
                           walking_always=True,
-                          natural_keys=True,
-                          several_path=False,
                           request=None):
-        model = obj.__class__
-        for field in model._meta.get_all_related_objects():
-            related_query_name = field.field.related_query_name()
+        """
+            Yield the objects related with obj by a reverse relation to walk into
+        """
+        for relation in get_model_relations(obj.__class__).reverses:
             walking_status = cls.walking_into_class(initial_obj,
                                                     obj,
-                                                    related_query_name,
-                                                    field.model,
+                                                    relation.name,
+                                                    relation.model,
                                                     walking_classes,
                                                     walking_always,
                                                     request=request)
             if walking_status != WALKING_INTO_CLASS:
                 continue
             try:
-                # This has to be getattr. If you use hasattr and this raise a Exception this return False
-                relation = getattr(obj, related_query_name, None)
-                if not relation:
-                    related_query_name = '%s_set' % related_query_name
-                    relation = getattr(obj, related_query_name)
-                if isinstance(relation, models.Model):
-                    contents = [relation]
-                else:
+                related = getattr(obj, relation.accessor_name)
+                if relation.multiple:
                     meta_class = cls.get_meta_walking_class(obj, walking_classes)
-                    contents = relation.all()
+                    contents = cls.select_natural_key_relations(related.all(),
+                                                                exclude=relation.field.name)
                     contents = meta_class.get_queryset_to_relation(initial_obj, obj,
-                                                                   related_query_name,
+                                                                   relation.accessor_name,
                                                                    contents,
                                                                    request=request)
+                else:
+                    contents = [related]
             except ObjectDoesNotExist:
                 contents = []
+            parent_value = getattr(obj, relation.parent_attname)
             for content in contents:
-                if content and not content in object_list:
-                    cls.objects_to_serialize(initial_obj, content, object_list,
+                if content:
+                    if (isinstance(content, relation.model) and
+                            getattr(content, relation.field.attname) == parent_value):
+                        # The children know their parent, not every related manager does it (Django 1.4)
+                        setattr(content, relation.field.get_cache_name(), obj)
+                    yield content
+
+    @classmethod
+    def serialize_reverse_batch(cls, initial_obj, objs,
+                                walking_classes=None,
+                                walking_always=True,
+                                request=None):
+        """
+            Given a list of objects, return for each one the list of objects related by a
+            reverse relation to walk into. Every relation is loaded with one query
+            (field__in=[parent ids]) for all the objects and grouped by parent.
+        """
+        to_load = {}
+        objs_relations = []
+        for obj in objs:
+            obj_relations = []
+            for relation in get_model_relations(obj.__class__).reverses:
+                walking_status = cls.walking_into_class(initial_obj,
+                                                        obj,
+                                                        relation.name,
+                                                        relation.model,
+                                                        walking_classes,
+                                                        walking_always,
+                                                        request=request)
+                if walking_status != WALKING_INTO_CLASS:
+                    continue
+                parent_value = getattr(obj, relation.parent_attname)
+                if parent_value is None:
+                    continue
+                to_load.setdefault(relation, set()).add(parent_value)
+                obj_relations.append((relation, parent_value))
+            objs_relations.append(obj_relations)
+
+        loaded = {}
+        for relation, parent_values in to_load.items():
+            children = loaded[relation] = {}
+            for values_chunk in chunked(list(parent_values), BATCH_SIZE):
+                queryset = relation.model._default_manager.filter(**{'%s__in' % relation.field.name: values_chunk})
+                queryset = cls.select_natural_key_relations(queryset, exclude=relation.field.name)
+                for content in queryset:
+                    children.setdefault(getattr(content, relation.field.attname), []).append(content)
+
+        contents = []
+        for obj, obj_relations in zip(objs, objs_relations):
+            obj_contents = []
+            if obj_relations:
+                meta_class = cls.get_meta_walking_class(obj, walking_classes)
+            for relation, parent_value in obj_relations:
+                related_contents = loaded[relation].get(parent_value, [])
+                for content in related_contents:
+                    # As the related managers do, the children know their parent
+                    setattr(content, relation.field.get_cache_name(), obj)
+                if relation.multiple:
+                    queryset = getattr(obj, relation.accessor_name).all()
+                    filtered = meta_class.get_queryset_to_relation(initial_obj, obj,
+                                                                   relation.accessor_name,
+                                                                   queryset,
+                                                                   request=request)
+                    if filtered is not queryset:
+                        # The walking class filters this relation, it has its own query
+                        related_contents = filtered
+                obj_contents.extend(content for content in related_contents if content)
+            contents.append(obj_contents)
+        return contents
+
+    @classmethod
+    def relations_to_serialize(cls, initial_obj, obj,
+                               walking_classes=None,
+                               walking_always=True,
+                               request=None,
+                               read_only=False):
+        """
+            Yield the objects related with obj to walk into, in the order of the
+            fk, m2m and reverse relations. This is lazy, so the walking_into_class
+            calls are interleaved with the walk of the related objects.
+        """
+        for content in cls.serialize_fk(initial_obj, obj,
+                                        walking_classes=walking_classes,
+                                        walking_always=walking_always,
+                                        request=request):
+            yield content
+        for content in cls.serialize_m2m(initial_obj, obj,
+                                         walking_classes=walking_classes,
+                                         walking_always=walking_always,
+                                         request=request,
+                                         read_only=read_only):
+            yield content
+        for content in cls.serialize_reverse(initial_obj, obj,
                                              walking_classes=walking_classes,
                                              walking_always=walking_always,
-                                             natural_keys=natural_keys,
-                                             several_path=several_path,
-                                             request=request)
-                elif content and several_path:
-                    cls.add_content(object_list, content,
-                                    natural_keys=natural_keys,
-                                    request=request)
+                                             request=request):
+            yield content
+
+    @classmethod
+    def walk(cls, initial_obj, obj,
+             walking_classes=None,
+             walking_always=True,
+             several_path=False,
+             request=None,
+             read_only=False,
+             visited=None,
+             expand_relations=False,
+             identity_map=None,
+             budget=None,
+             waiting=None):
+        """
+            Yield the objects to serialize in depth-first order. The walk uses
+            an explicit stack of relation iterators instead of recursion, so
+            there is no limit to the depth of the graph (but the depth of the budget).
+            With expand_relations the relations of an object are calculated before yielding it,
+            and the ids of its related objects by a foreign key are added to waiting (a set)
+            until they are walked.
+        """
+        walking_classes = walking_classes or []
+        if visited is None:
+            visited = set()
+        visited.add(get_content_key(obj))
+        if budget is not None:
+            budget.check_objects(len(visited))
+        cls.cache_natural_key(obj, identity_map)
+
+        def relations_to_serialize(content):
+            relations = cls.relations_to_serialize(initial_obj, content,
+                                                   walking_classes=walking_classes,
+                                                   walking_always=walking_always,
+                                                   request=request,
+                                                   read_only=read_only)
+            if expand_relations:
+                relations = list(relations)
+                for related in relations:
+                    cls.cache_natural_key(related, identity_map)
+                if waiting is not None:
+                    waiting.update(cls.get_fk_references(content, relations))
+                relations = iter(relations)
+            return relations
+
+        stack = [relations_to_serialize(obj)]
+        yield obj
+        while stack:
+            try:
+                content = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
+            if waiting is not None:
+                waiting.discard(id(content))
+            content_key = get_content_key(content)
+            if not content_key in visited:
+                visited.add(content_key)
+                if budget is not None:
+                    # The stack has an iterator per ancestor of the content
+                    budget.check_depth(len(stack))
+                    budget.check_objects(len(visited))
+                cls.cache_natural_key(content, identity_map)
+                stack.append(relations_to_serialize(content))
+                yield content
+            elif several_path:
+                yield content
+
+    @classmethod
+    def relations_to_serialize_batch(cls, initial_obj, objs,
+                                     walking_classes=None,
+                                     walking_always=True,
+                                     request=None,
+                                     read_only=False,
+                                     visited=None):
+        """
+            Return the objects related with objs to walk into, every relation
+            of all the objects is loaded together
+        """
+        objs_fk_contents = cls.serialize_fk_batch(initial_obj, objs,
+                                                  walking_classes=walking_classes,
+                                                  walking_always=walking_always,
+                                                  request=request,
+                                                  visited=visited)
+        objs_m2m_contents = cls.serialize_m2m_batch(initial_obj, objs,
+                                                    walking_classes=walking_classes,
+                                                    walking_always=walking_always,
+                                                    request=request,
+                                                    read_only=read_only)
+        objs_reverse_contents = cls.serialize_reverse_batch(initial_obj, objs,
+                                                            walking_classes=walking_classes,
+                                                            walking_always=walking_always,
+                                                            request=request)
+        contents = []
+        for fk_contents, m2m_contents, reverse_contents in zip(objs_fk_contents,
+                                                               objs_m2m_contents,
+                                                               objs_reverse_contents):
+            contents.extend(fk_contents)
+            contents.extend(m2m_contents)
+            contents.extend(reverse_contents)
+        return contents
+
+    @classmethod
+    def walk_batched(cls, initial_obj, obj,
+                     walking_classes=None,
+                     walking_always=True,
+                     several_path=False,
+                     request=None,
+                     read_only=False,
+                     visited=None,
+                     identity_map=None,
+                     budget=None,
+                     waiting=None):
+        """
+            Yield the objects to serialize in breadth-first order. The relations
+            of every level of the graph are loaded together, with one query per
+            related model instead of one query per object. The objects of a level
+            are yielded when their relations are loaded, and the natural keys of
+            the related objects are cached before, the hooks of the level can
+            change the objects used by these natural keys (e.g. the parent).
+            The ids of the related objects by a foreign key are added to waiting
+            (a set) until they are yielded.
+        """
+        walking_classes = walking_classes or []
+        if visited is None:
+            visited = set()
+        visited.add(get_content_key(obj))
+        if budget is not None:
+            budget.check_objects(len(visited))
+        cls.cache_natural_key(obj, identity_map)
+        # With several paths the visited objects have to be loaded again
+        not_load = None if several_path else visited
+        frontier = [obj]
+        level = [obj]
+        depth = 0
+        while level:
+            if frontier:
+                contents = cls.relations_to_serialize_batch(initial_obj, frontier,
+                                                            walking_classes=walking_classes,
+                                                            walking_always=walking_always,
+                                                            request=request,
+                                                            read_only=read_only,
+                                                            visited=not_load)
+            else:
+                contents = []
+            for content in contents:
+                cls.cache_natural_key(content, identity_map)
+            if waiting is not None:
+                for frontier_obj in frontier:
+                    waiting.update(cls.get_fk_references(frontier_obj, contents))
+            for content in level:
+                if waiting is not None:
+                    waiting.discard(id(content))
+                yield content
+            frontier = []
+            level = []
+            depth += 1
+            for content in contents:
+                content_key = get_content_key(content)
+                if not content_key in visited:
+                    visited.add(content_key)
+                    if budget is not None:
+                        budget.check_depth(depth)
+                        budget.check_objects(len(visited))
+                    frontier.append(content)
+                    level.append(content)
+                elif several_path:
+                    level.append(content)
+                elif waiting is not None:
+                    waiting.discard(id(content))
 
     @classmethod
     def add_content(cls, object_list, content, natural_keys=True, request=None):
@@ -223,32 +676,292 @@ class Serializer(BaseMetaWalkClassProvider):
                              walking_always=True,
                              natural_keys=True,
                              several_path=False,
-                             request=None):
+                             request=None,
+                             read_only=False,
+                             batched=False,
+                             identity_map=None,
+                             visited=None,
+                             budget=None,
+                             cancelled=None):
+        if visited is None:
+            visited = set(get_content_key(content) for content in object_list)
+        if batched:
+            walk = cls.walk_batched
+        else:
+            walk = cls.walk
+        for content in walk(initial_obj, obj,
+                            walking_classes=walking_classes,
+                            walking_always=walking_always,
+                            several_path=several_path,
+                            request=request,
+                            read_only=read_only,
+                            visited=visited,
+                            identity_map=identity_map,
+                            budget=budget):
+            check_cancelled(cancelled)
+            cls.add_content(object_list, content,
+                            natural_keys=natural_keys,
+                            request=request)
+
+    @classmethod
+    def contents_to_serialize(cls, initial_obj,
+                              walking_classes=None,
+                              walking_always=True,
+                              natural_keys=True,
+                              several_path=False,
+                              serialize_options=None,
+                              request=None,
+                              read_only=False,
+                              batched=False,
+                              identity_map=None,
+                              visited=None,
+                              serialized=None,
+                              budget=None,
+                              waiting=None):
+        """
+            Yield the objects to serialize, treated by pre_serialize, while the graph
+            is walked. An object is yielded when its relations are walked, so the
+            walked objects are not kept in memory (only their keys). The related
+            objects by a foreign key not walked yet are added to waiting (see hold_back_contents)
+        """
+        if batched:
+            contents = cls.walk_batched(initial_obj, initial_obj,
+                                        walking_classes=walking_classes,
+                                        walking_always=walking_always,
+                                        several_path=several_path,
+                                        request=request,
+                                        read_only=read_only,
+                                        visited=visited,
+                                        identity_map=identity_map,
+                                        budget=budget,
+                                        waiting=waiting)
+        else:
+            contents = cls.walk(initial_obj, initial_obj,
+                                walking_classes=walking_classes,
+                                walking_always=walking_always,
+                                several_path=several_path,
+                                request=request,
+                                read_only=read_only,
+                                visited=visited,
+                                expand_relations=True,
+                                identity_map=identity_map,
+                                budget=budget,
+                                waiting=waiting)
+
+        def added_contents():
+            object_list = []
+            for content in contents:
+                cls.add_content(object_list, content,
+                                natural_keys=natural_keys,
+                                request=request)
+                for added_content in object_list:
+                    yield added_content
+                del object_list[:]
+        return cls.pre_serialize_contents(initial_obj, added_contents(),
+                                          walking_classes=walking_classes,
+                                          serialize_options=serialize_options,
+                                          request=request,
+                                          serialized=serialized)
+
+    @classmethod
+    def hold_back_contents(cls, contents, waiting):
+        """
+            Yield the contents in the same order, but a content is held back while an object
+            that it references by a foreign key is waiting to be walked: the serializers use
+            this object, so its hooks have to run before writing the content (as without stream)
+        """
+        held = collections.deque()
+        for content in contents:
+            held.append(content)
+            while held and not cls.references_waiting(held[0], waiting):
+                yield held.popleft()
+        while held:
+            yield held.popleft()
+
+    @classmethod
+    def pre_serialize_contents(cls, initial_obj, contents,
+                               walking_classes=None,
+                               serialize_options=None,
+                               request=None,
+                               serialized=None):
+        """
+            Yield the contents treated by the pre_serialize of their walking classes,
+            without repeated objects. The repeated objects are found by their key
+            (model, primary key), or by their identity if they do not have primary key
+        """
+        if serialized is None:
+            serialized = set()
+        for content_to_serialize in cls._pre_serialize_contents(initial_obj, contents,
+                                                                walking_classes=walking_classes,
+                                                                serialize_options=serialize_options,
+                                                                request=request):
+            if not content_to_serialize:
+                continue
+            if content_to_serialize.pk is not None:
+                content_key = get_content_key(content_to_serialize)
+            else:
+                # E.g. a new object returned by the hooks for several contents
+                content_key = ObjectKey(content_to_serialize)
+            if content_key in serialized:
+                continue
+            serialized.add(content_key)
+            yield content_to_serialize
+
+    @classmethod
+    def _pre_serialize_contents(cls, initial_obj, contents,
+                                walking_classes=None,
+                                serialize_options=None,
+                                request=None):
+        """
+            Yield the result of pre_serialize for every content. The walking class is
+            looked for once per model. The walking classes with pre_serialize_batch
+            treat the contents of their model together, in groups of BATCH_SIZE contents.
+        """
+        meta_walking_classes = {}
+        pending = []
+        for content in contents:
+            model = content.__class__
+            meta_walking_class = meta_walking_classes.get(model, None)
+            if meta_walking_class is None:
+                meta_walking_class = meta_walking_classes[model] = cls.get_meta_walking_class(model, walking_classes)
+            if pending or meta_walking_class.has_batch_hook('pre_serialize_batch'):
+                # The contents keep their order, so the next contents wait too
+                pending.append((content, meta_walking_class))
+                if len(pending) >= BATCH_SIZE:
+                    for content_to_serialize in cls.pre_serialize_batch(initial_obj, pending,
+                                                                        serialize_options=serialize_options,
+                                                                        request=request):
+                        yield content_to_serialize
+                    pending = []
+            else:
+                yield meta_walking_class.pre_serialize(initial_obj, content, request, serialize_options)
+        if pending:
+            for content_to_serialize in cls.pre_serialize_batch(initial_obj, pending,
+                                                                serialize_options=serialize_options,
+                                                                request=request):
+                yield content_to_serialize
+
+    @classmethod
+    def pre_serialize_batch(cls, initial_obj, pending,
+                            serialize_options=None,
+                            request=None):
+        """
+            Given a list of (content, walking class) return the result of pre_serialize
+            for every content, in the same order. The contents of a walking class with
+            pre_serialize_batch are treated together, when the first one is found.
+        """
+        groups = {}
+        for num_content, (content, meta_walking_class) in enumerate(pending):
+            if meta_walking_class.has_batch_hook('pre_serialize_batch'):
+                groups.setdefault(content.__class__, []).append(num_content)
+        contents_to_serialize = [None] * len(pending)
+        for num_content, (content, meta_walking_class) in enumerate(pending):
+            group = groups.get(content.__class__, None)
+            if group is None:
+                contents_to_serialize[num_content] = meta_walking_class.pre_serialize(initial_obj, content, request,
+                                                                                      serialize_options)
+            elif group[0] == num_content:
+                group_contents = [pending[num_group_content][0] for num_group_content in group]
+                group_contents = meta_walking_class.pre_serialize_batch(initial_obj, group_contents, request,
+                                                                        serialize_options)
+                for num_group_content, content_to_serialize in zip(group, group_contents):
+                    contents_to_serialize[num_group_content] = content_to_serialize
+        return contents_to_serialize
+
+    @classmethod
+    def explain(cls, initial_obj,
+                walking_classes=None,
+                walking_always=False,
+                request=None,
+                batched=False):
+        """
+            Return the plan of the serialization of initial_obj without walking it: for every
+            model, the number of objects to serialize and the walking status of its relations,
+            with the number of related objects of the relations to walk into. The numbers are
+            COUNT queries, they are estimates: the walking status is asked with an object with the
+            primary key of the first object of every model (only the primary key is loaded), and
+            the querysets are not filtered by get_queryset_to_relation.
+            The number of queries of the serialization (batched or not) is estimated too.
+        """
         walking_classes = walking_classes or []
-        cls.add_content(object_list, obj,
-                        natural_keys=natural_keys,
-                        request=request)
-        cls.serialize_fk(initial_obj,
-                         obj, object_list,
-                         walking_classes=walking_classes,
-                         walking_always=walking_always,
-                         natural_keys=natural_keys,
-                         several_path=several_path,
-                         request=request)
-        cls.serialize_m2m(initial_obj,
-                          obj,
-                          object_list,
-                          walking_classes=walking_classes,
-                          walking_always=walking_always,
-                          natural_keys=natural_keys,
-                          several_path=several_path,
-                          request=request)
-        cls.serialize_reverse(initial_obj, obj, object_list,
-                              walking_classes=walking_classes,
-                              walking_always=walking_always,
-                              natural_keys=natural_keys,
-                              several_path=several_path,
-                              request=request)
+        initial_model = initial_obj.__class__
+        querysets = {initial_model: [initial_model._default_manager.filter(pk=initial_obj.pk)]}
+        models_to_explain = [initial_model]
+        models_relations = {}
+        num_queries = 0
+        for model in models_to_explain:
+            queryset = cls.explain_queryset(model, querysets[model])
+            if model is initial_model:
+                obj = initial_obj
+            else:
+                # The relations are known by the model, only the primary key of an object is loaded
+                pks = list(queryset.values_list('pk', flat=True)[:1])
+                obj = pks and model(pk=pks[0]) or None
+            relations = models_relations[model] = {}
+            if obj is None:
+                continue
+            num_objs = None
+            for field_name, related_model, related_queryset in cls.explain_relations(model, queryset):
+                walking_status = cls.walking_into_class(initial_obj, obj, field_name,
+                                                        related_model,
+                                                        walking_classes,
+                                                        walking_always,
+                                                        request=request)
+                relation = relations[field_name] = {'model': get_model_label(related_model),
+                                                    'walking_status': walking_status,
+                                                    'count': None}
+                if walking_status != WALKING_INTO_CLASS:
+                    continue
+                relation['count'] = related_queryset.count()
+                querysets.setdefault(related_model, []).append(related_queryset)
+                if not related_model in models_to_explain:
+                    models_to_explain.append(related_model)
+                if batched:
+                    # The batched walk loads every relation once per level
+                    num_queries += 1
+                else:
+                    # The depth-first walk loads every relation once per object
+                    if num_objs is None:
+                        num_objs = queryset.count()
+                    num_queries += num_objs
+        plan = {'models': {}, 'num_objects': 0, 'num_queries': num_queries}
+        for model in models_to_explain:
+            count = cls.explain_queryset(model, querysets[model]).distinct().count()
+            plan['models'][get_model_label(model)] = {'count': count,
+                                                      'relations': models_relations[model]}
+            plan['num_objects'] += count
+        return plan
+
+    @classmethod
+    def explain_queryset(cls, model, querysets):
+        """
+            Return a queryset of the objects of the model in any of the querysets,
+            these are combined by their primary keys (subqueries)
+        """
+        if len(querysets) == 1:
+            return querysets[0]
+        return model._default_manager.filter(functools.reduce(operator.or_,
+                                                              [models.Q(pk__in=queryset.values('pk'))
+                                                               for queryset in querysets]))
+
+    @classmethod
+    def explain_relations(cls, model, queryset):
+        """
+            Yield (relation name, related model, queryset of the related objects) for every
+            relation of the model, the querysets are subqueries of the queryset
+        """
+        relations = get_model_relations(model)
+        for field in relations.fks:
+            yield (field.name, field.rel.to,
+                   field.rel.to._default_manager.filter(**{'%s__in' % field.rel.field_name:
+                                                           queryset.values(field.attname)}))
+        for field in relations.m2ms:
+            yield (field.name, field.rel.to,
+                   field.rel.to._default_manager.filter(pk__in=queryset.values(field.name)))
+        for relation in relations.reverses:
+            yield (relation.name, relation.model,
+                   relation.model._default_manager.filter(**{'%s__in' % relation.field.name:
+                                                             queryset.values(relation.parent_attname)}))
 
     @classmethod
     def serialize(cls, initial_obj,
@@ -258,31 +971,200 @@ class Serializer(BaseMetaWalkClassProvider):
                   indent=None,
                   serialize_options=None,
                   can_get_objs_from_several_path=False,
-                  request=None):
-        serialize_options = serialize_options or {}
+                  request=None,
+                  batched=False,
+                  read_only=False,
+                  stream=None,
+                  cancelled=None,
+                  max_objects=None,
+                  max_depth=None,
+                  max_bytes=None):
+        """
+            Serialize initial_obj and the objects related with it. The walk can
+            change the database (the stopped many to many relations are cleared),
+            so it is rolled back at the end. With read_only the stopped relations
+            are only emptied in memory, there is not any write or transaction,
+            so it can be used with a read replica. With a stream the objects are
+            serialized into it while the graph is walked. If cancelled (e.g. a
+            threading.Event) is set the serialization raises SerializationCancelled.
+            The serialization raises SerializationBudgetExceeded if it walks more
+            than max_objects objects, deeper than max_depth relations from initial_obj,
+            or if the fixtures have more than max_bytes bytes (only the text formats,
+            with a stream while they are written, without it when they are serialized).
+        """
+        return cls.serialize_many([initial_obj],
+                                  walking_classes=walking_classes,
+                                  walking_always=walking_always,
+                                  natural_keys=natural_keys,
+                                  indent=indent,
+                                  serialize_options=serialize_options,
+                                  can_get_objs_from_several_path=can_get_objs_from_several_path,
+                                  request=request,
+                                  batched=batched,
+                                  read_only=read_only,
+                                  stream=stream,
+                                  cancelled=cancelled,
+                                  max_objects=max_objects,
+                                  max_depth=max_depth,
+                                  max_bytes=max_bytes)
+
+    @classmethod
+    def serialize_many(cls, initial_objs,
+                       walking_classes=None,
+                       walking_always=False,
+                       natural_keys=True,
+                       indent=None,
+                       serialize_options=None,
+                       can_get_objs_from_several_path=False,
+                       request=None,
+                       batched=False,
+                       read_only=False,
+                       stream=None,
+                       cancelled=None,
+                       max_objects=None,
+                       max_depth=None,
+                       max_bytes=None):
+        """
+            Serialize several initial objects (and the objects related with them)
+            in the same fixtures. The walks share the visited objects, so an object
+            related with several initial objects is serialized once. The hooks get
+            as initial_obj the first initial object that reaches the object.
+        """
+        if read_only:
+            return cls._serialize(initial_objs,
+                                  walking_classes=walking_classes,
+                                  walking_always=walking_always,
+                                  natural_keys=natural_keys,
+                                  indent=indent,
+                                  serialize_options=serialize_options,
+                                  can_get_objs_from_several_path=can_get_objs_from_several_path,
+                                  request=request,
+                                  batched=batched,
+                                  read_only=read_only,
+                                  stream=stream,
+                                  cancelled=cancelled,
+                                  max_objects=max_objects,
+                                  max_depth=max_depth,
+                                  max_bytes=max_bytes)
+        with transaction.commit_manually():
+            try:
+                fixtures = cls._serialize(initial_objs,
+                                          walking_classes=walking_classes,
+                                          walking_always=walking_always,
+                                          natural_keys=natural_keys,
+                                          indent=indent,
+                                          serialize_options=serialize_options,
+                                          can_get_objs_from_several_path=can_get_objs_from_several_path,
+                                          request=request,
+                                          batched=batched,
+                                          stream=stream,
+                                          cancelled=cancelled,
+                                          max_objects=max_objects,
+                                          max_depth=max_depth,
+                                          max_bytes=max_bytes)
+            finally:
+                transaction.rollback()
+        return fixtures
+
+    @classmethod
+    def _serialize(cls, initial_objs,
+                   walking_classes=None,
+                   walking_always=False,
+                   natural_keys=True,
+                   indent=None,
+                   serialize_options=None,
+                   can_get_objs_from_several_path=False,
+                   request=None,
+                   batched=False,
+                   read_only=False,
+                   stream=None,
+                   cancelled=None,
+                   max_objects=None,
+                   max_depth=None,
+                   max_bytes=None):
+        serialize_options = dict(serialize_options or {})
         walking_classes = walking_classes or []
-        object_list = []
+        identity_map = None
         if natural_keys:
             serialize_options['use_natural_primary_keys'] = True
             serialize_options['use_natural_foreign_keys'] = True
+            if cls.use_internal_serializer():
+                # The natural keys of the walked and loaded objects,
+                # the internal serializers use them to resolve the relations
+                identity_map = serialize_options['identity_map'] = IdentityMap()
+        budget = None
+        if max_objects is not None or max_depth is not None or max_bytes is not None:
+            budget = SerializationBudget(max_objects=max_objects,
+                                         max_depth=max_depth,
+                                         max_bytes=max_bytes)
+            if max_bytes is not None and stream is not None:
+                # The bytes are counted while the objects are written
+                stream = BudgetStream(stream, budget)
+        visited = set()
+        serialized = set()
+        if stream is not None:
+            waiting = set()
+
+            def initial_objs_contents():
+                for initial_obj in initial_objs:
+                    if get_content_key(initial_obj) in visited:
+                        continue
+                    for content in cls.contents_to_serialize(initial_obj,
+                                                             walking_classes=walking_classes,
+                                                             walking_always=walking_always,
+                                                             natural_keys=natural_keys,
+                                                             several_path=can_get_objs_from_several_path,
+                                                             serialize_options=serialize_options,
+                                                             request=request,
+                                                             read_only=read_only,
+                                                             batched=batched,
+                                                             identity_map=identity_map,
+                                                             visited=visited,
+                                                             serialized=serialized,
+                                                             budget=budget,
+                                                             waiting=waiting):
+                        check_cancelled(cancelled)
+                        yield content
+            contents = cls.hold_back_contents(initial_objs_contents(), waiting)
+            # The pre_serialize of the initial object can change the serialize_options,
+            # this is called before to start the serialization
+            first_contents = list(itertools.islice(contents, 1))
+            return serializers.serialize(cls.format,
+                                         itertools.chain(first_contents, contents),
+                                         indent=indent, stream=stream,
+                                         **serialize_options)
+        objects_lists = []
+        for initial_obj in initial_objs:
+            if get_content_key(initial_obj) in visited:
+                continue
+            check_cancelled(cancelled)
+            object_list = []
+            cls.objects_to_serialize(initial_obj, initial_obj, object_list,
+                                     walking_classes=walking_classes,
+                                     walking_always=walking_always,
+                                     natural_keys=natural_keys,
+                                     several_path=can_get_objs_from_several_path,
+                                     request=request,
+                                     read_only=read_only,
+                                     batched=batched,
+                                     identity_map=identity_map,
+                                     visited=visited,
+                                     budget=budget,
+                                     cancelled=cancelled)
+            objects_lists.append((initial_obj, object_list))
         contents_to_serialize = []
-        with transaction.commit_manually():
-            try:
-                cls.objects_to_serialize(initial_obj, initial_obj, object_list,
-                                         walking_classes=walking_classes,
-                                         walking_always=walking_always,
-                                         natural_keys=natural_keys,
-                                         several_path=can_get_objs_from_several_path,
-                                         request=request)
-                for content in object_list:
-                    meta_walking_class = cls.get_meta_walking_class(content, walking_classes)
-                    content_to_serialize = meta_walking_class.pre_serialize(initial_obj, content, request, serialize_options)
-                    if content_to_serialize and not content_to_serialize in contents_to_serialize:
-                        contents_to_serialize.append(content_to_serialize)
-                fixtures = serializers.serialize(cls.format, contents_to_serialize, indent=indent,
-                                                 **serialize_options)
-            finally:
-                transaction.rollback()
+        for initial_obj, object_list in objects_lists:
+            check_cancelled(cancelled)
+            contents_to_serialize.extend(cls.pre_serialize_contents(initial_obj, object_list,
+                                                                    walking_classes=walking_classes,
+                                                                    serialize_options=serialize_options,
+                                                                    request=request,
+                                                                    serialized=serialized))
+        fixtures = serializers.serialize(cls.format, contents_to_serialize, indent=indent,
+                                         **serialize_options)
+        if budget is not None and isinstance(fixtures, six.string_types):
+            # Without stream the bytes are counted when the fixtures are serialized
+            budget.check_bytes(get_num_bytes(fixtures))
         return fixtures
 
 
@@ -298,7 +1180,33 @@ class Deserializer(BaseMetaWalkClassProvider):
                     deserialize_options=None,
                     request=None,
                     pretreatment_fixtures=False,
-                    pretreatment_fixtures_sorted_function=None):
+                    pretreatment_fixtures_sorted_function=None,
+                    cancelled=None,
+                    two_phase=False,
+                    bulk=False,
+                    bulk_size=None):
+        """
+            Save the objects of the fixtures in a transaction, sorted by dependencies.
+            With two_phase the nullable foreign keys that close a cycle (e.g. WebSite.initial_page)
+            are saved empty, and they are updated when all the objects are saved (before
+            post_save_batch), with one query per model and field.
+            With bulk the objects are inserted with bulk_create, level by level (the
+            objects of a level only reference objects of the previous levels), with one
+            query per model and bulk_size objects (DEEP_SERIALIZER_BATCH_SIZE by default).
+            The objects have to be new, and they are not saved (there are not signals).
+            bulk_create does not set the primary keys, so the objects without primary key
+            in the fixtures get them by their natural keys after the insert (one query per
+            model if the manager has a get_by_natural_keys method), and the ones without
+            natural key are saved one by one.
+            If cancelled (e.g. a threading.Event) is set the deserialization raises
+            SerializationCancelled before to save the next object, and the transaction
+            is rolled back.
+            With the internal serializers the natural keys of the relations are resolved
+            with the objects saved before (by the natural key of the fixtures, before
+            pre_save), and every object out of the fixtures is queried once. The objects
+            referenced by natural key are loaded before with one query per model, if the
+            manager of the model has a get_by_natural_keys method (see prefetch_natural_keys).
+        """
         with transaction.commit_manually():
             try:
                 if pretreatment_fixtures:
@@ -307,6 +1215,11 @@ class Deserializer(BaseMetaWalkClassProvider):
                                                          walking_classes,
                                                          deserialize_options,
                                                          pretreatment_fixtures_sorted_function)
+                fixtures, deferred_fks, levels = cls.sort_fixtures(fixtures, two_phase=two_phase, bulk=bulk)
+                deferred = []
+                saved_objects = SavedObjects()
+                if natural_keys and USE_INTERNAL_SERIALIZERS:
+                    cls.prefetch_natural_keys(fixtures, saved_objects, using=using)
                 contents = cls._deserialize(fixtures,
                                             initial_obj=initial_obj,
                                             walking_classes=walking_classes,
@@ -314,7 +1227,17 @@ class Deserializer(BaseMetaWalkClassProvider):
                                             natural_keys=natural_keys,
                                             exclude_contents=exclude_contents,
                                             deserialize_options=deserialize_options,
-                                            request=request)
+                                            request=request,
+                                            cancelled=cancelled,
+                                            deferred_fks=deferred_fks,
+                                            deferred=deferred,
+                                            levels=levels,
+                                            bulk_size=bulk_size,
+                                            saved_objects=saved_objects)
+                cls.update_deferred_fks(deferred, using=using, saved_objects=saved_objects)
+                cls.post_save_batch(initial_obj, contents,
+                                    walking_classes=walking_classes,
+                                    request=request)
                 transaction.commit()
                 return contents
             except Exception as e:
@@ -334,21 +1257,39 @@ class Deserializer(BaseMetaWalkClassProvider):
                      deserialize_options=None,
                      request=None,
                      contents=None,
-                     num_reorder=0):
+                     num_reorder=0,
+                     cancelled=None,
+                     deferred_fks=None,
+                     deferred=None,
+                     levels=None,
+                     bulk_size=None,
+                     saved_objects=None):
         deserialize_options = deserialize_options or {}
         if natural_keys:
             deserialize_options['use_natural_primary_keys'] = True
             deserialize_options['use_natural_foreign_keys'] = True
+        if saved_objects is None:
+            saved_objects = SavedObjects()
+        if USE_INTERNAL_SERIALIZERS:
+            deserialize_options['saved_objects'] = saved_objects
         objects = serializers.deserialize(cls.format, fixtures, using=using,
                                           **deserialize_options)
-        exclude_contents = exclude_contents or []
+        if not isinstance(exclude_contents, set):
+            exclude_contents = set(exclude_contents or [])
         contents = contents or []
         init = True
         obj_does_not_exist = False
         obj = None
         num_item = 0
+        pending = []
         while obj or init:
             init = False
+            if pending and num_item < len(levels) and levels[num_item] != levels[num_item - 1]:
+                # The next objects can reference the pending objects
+                cls.bulk_save(initial_obj, pending, contents, deferred,
+                              using=using, bulk_size=bulk_size, request=request,
+                              saved_objects=saved_objects)
+                pending = []
             try:
                 if PY3:
                     obj = objects.__next__()
@@ -363,23 +1304,40 @@ class Deserializer(BaseMetaWalkClassProvider):
             if natural_keys:
                 if not has_natural_key(obj.object):
                     raise DoesNotNaturalKeyException("The model %s don't have a natural key" % obj.object.__class__)
+                natural_key = obj.object.natural_key()
                 obj_key = '%s__%s__%s' % (obj.object._meta.app_label,
                                           obj.object._meta.module_name,
-                                          obj.object.natural_key())
+                                          natural_key)
             else:
+                natural_key = None
                 obj_key = '%s__%s__%s' % (obj.object._meta.app_label,
                                           obj.object._meta.module_name,
                                           obj.object.pk)
             if not obj_key in exclude_contents:
+                check_cancelled(cancelled)
                 meta_walking_class = cls.get_meta_walking_class(obj.object, walking_classes)
                 meta_walking_class.pre_save(initial_obj, obj.object, request=request)
-                obj.save(using=using)
-                meta_walking_class.post_save(initial_obj, obj.object, request=request)
-                contents.append(obj.object)
-                exclude_contents.append(obj_key)
+                obj_deferred_fks = deferred_fks and deferred_fks[num_item - 1] or []
+                if levels is None:
+                    obj.save(using=using)
+                    cls.object_saved(initial_obj, obj.object, meta_walking_class, obj_deferred_fks,
+                                     contents, deferred, request=request,
+                                     natural_key=natural_key, saved_objects=saved_objects)
+                else:
+                    pending.append((obj, meta_walking_class, obj_deferred_fks, natural_key))
+                exclude_contents.add(obj_key)
+        if pending:
+            cls.bulk_save(initial_obj, pending, contents, deferred,
+                          using=using, bulk_size=bulk_size, request=request,
+                          saved_objects=saved_objects)
         if obj_does_not_exist:
             num_reorder = num_reorder + 1
             fixtures = cls.deserialize_reorder(fixtures, num_item, num_reorder)
+            # Like the objects, the object num_item after the next objects
+            if deferred_fks:
+                deferred_fks = deferred_fks[num_item + 1:] + deferred_fks[num_item:num_item + 1]
+            if levels:
+                levels = levels[num_item + 1:] + levels[num_item:num_item + 1]
             cls._deserialize(fixtures,
                              initial_obj=initial_obj,
                              walking_classes=walking_classes,
@@ -389,9 +1347,245 @@ class Deserializer(BaseMetaWalkClassProvider):
                              deserialize_options=deserialize_options,
                              request=request,
                              contents=contents,
-                             num_reorder=num_reorder)
+                             num_reorder=num_reorder,
+                             cancelled=cancelled,
+                             deferred_fks=deferred_fks,
+                             deferred=deferred,
+                             levels=levels,
+                             bulk_size=bulk_size,
+                             saved_objects=saved_objects)
         return contents
 
+    @classmethod
+    def object_saved(cls, initial_obj, obj, meta_walking_class, obj_deferred_fks, contents, deferred,
+                     request=None,
+                     natural_key=None,
+                     saved_objects=None):
+        if natural_key is not None and saved_objects is not None:
+            saved_objects.add(obj.__class__, natural_key, obj.pk, obj)
+        for field_name, reference in obj_deferred_fks:
+            deferred.append((obj, field_name, reference))
+        if not meta_walking_class.has_batch_hook('post_save_batch'):
+            meta_walking_class.post_save(initial_obj, obj, request=request)
+        contents.append(obj)
+
+    @classmethod
+    def bulk_save(cls, initial_obj, pending, contents, deferred,
+                  using='default',
+                  bulk_size=None,
+                  request=None,
+                  saved_objects=None):
+        """
+            Insert the pending objects, a list of (deserialized object, walking class, deferred
+            foreign keys, natural key), with bulk_create: one query per model and bulk_size objects, and one
+            query per many to many relation. bulk_create does not set the primary keys, so the objects
+            without primary key get them by their natural keys after the insert (load_pks). The objects
+            of an inherited model, and the objects without primary key that can not be loaded by their
+            natural keys are saved one by one.
+        """
+        bulk_size = bulk_size or BATCH_SIZE
+        if saved_objects is None:
+            saved_objects = SavedObjects()
+        models = []
+        models_objs = {}
+        for obj, meta_walking_class, obj_deferred_fks, natural_key in pending:
+            model = obj.object.__class__
+            if model._meta.parents or (obj.object.pk is None and not cls.can_load_pks(model, natural_key)):
+                obj.save(using=using)
+                continue
+            if not model in models_objs:
+                models.append(model)
+                models_objs[model] = []
+            models_objs[model].append(obj)
+        for model in models:
+            objs = models_objs[model]
+            manager = model._base_manager.db_manager(using)
+            for objs_chunk in chunked(objs, bulk_size):
+                objs_without_pk = [obj.object for obj in objs_chunk if obj.object.pk is None]
+                manager.bulk_create([obj.object for obj in objs_chunk])
+                if objs_without_pk:
+                    cls.load_pks(model, objs_without_pk, using=using, saved_objects=saved_objects)
+            for field in get_model_relations(model).m2ms:
+                through = field.rel.through
+                from_attname = through._meta.get_field(field.m2m_field_name()).attname
+                to_attname = through._meta.get_field(field.m2m_reverse_field_name()).attname
+                rows = [through(**{from_attname: obj.object.pk, to_attname: value})
+                        for obj in objs
+                        for value in obj.m2m_data.get(field.name, ())]
+                for rows_chunk in chunked(rows, bulk_size):
+                    through._base_manager.db_manager(using).bulk_create(rows_chunk)
+        for obj, meta_walking_class, obj_deferred_fks, natural_key in pending:
+            cls.object_saved(initial_obj, obj.object, meta_walking_class, obj_deferred_fks,
+                             contents, deferred, request=request,
+                             natural_key=natural_key, saved_objects=saved_objects)
+
+    @classmethod
+    def can_load_pks(cls, model, natural_key):
+        """
+            Return if the objects of the model inserted without primary key can get
+            it by their natural keys (load_pks)
+        """
+        return natural_key is not None and hasattr(model._default_manager, 'get_by_natural_key')
+
+    @classmethod
+    def load_pks(cls, model, objs, using='default', saved_objects=None):
+        """
+            Set the primary keys of the objects inserted without them, by their natural
+            keys: with one query per BATCH_SIZE objects if the manager of the model has
+            a get_by_natural_keys method (SavedObjects.prefetch), otherwise one by one
+        """
+        if saved_objects is None:
+            saved_objects = SavedObjects()
+        # The natural keys after pre_save, these are the saved ones
+        natural_keys = [obj.natural_key() for obj in objs]
+        saved_objects.prefetch(model, natural_keys, using=using)
+        for obj, natural_key in zip(objs, natural_keys):
+            obj.pk = saved_objects.get_pk(model, natural_key, using=using)
+
+    @classmethod
+    def post_save_batch(cls, initial_obj, contents,
+                        walking_classes=None,
+                        request=None):
+        """
+            Call the post_save_batch of the walking classes that implement it,
+            once per model when all the contents are saved
+        """
+        models = []
+        models_contents = {}
+        for content in contents:
+            model = content.__class__
+            if not model in models_contents:
+                meta_walking_class = cls.get_meta_walking_class(model, walking_classes)
+                if not meta_walking_class.has_batch_hook('post_save_batch'):
+                    models_contents[model] = None
+                    continue
+                models.append((model, meta_walking_class))
+                models_contents[model] = []
+            if models_contents[model] is not None:
+                models_contents[model].append(content)
+        for model, meta_walking_class in models:
+            meta_walking_class.post_save_batch(initial_obj, models_contents[model], request=request)
+
+    @classmethod
+    def sort_fixtures(cls, fixtures, two_phase=False, bulk=False):
+        """
+            Return the fixtures with every object after the objects of the fixtures that
+            it references, so every object is saved once. The objects of a cycle keep their
+            order, if they can not be saved they are reordered (deserialize_reorder).
+            With two_phase the deferred foreign keys are emptied in the fixtures, and they
+            are returned too: for every object, a list of (field name, reference).
+            With bulk the level of every object is returned too.
+        """
+        items = cls.get_fixtures_items(fixtures)
+        items_data = [cls.get_fixtures_item_data(item) for item in items]
+        order, deferred, levels = sort_by_dependencies(items_data, two_phase=two_phase, bulk=bulk)
+        if not deferred:
+            if order == list(range(len(items))):
+                return fixtures, None, levels
+            return cls.set_fixtures_items(fixtures, [items[num_item] for num_item in order]), None, levels
+        positions = dict((num_item, position) for position, num_item in enumerate(order))
+        items = [items[num_item] for num_item in order]
+        deferred_fks = [[] for item in items]
+        for num_item, field_name in deferred:
+            position = positions[num_item]
+            deferred_fks[position].append((field_name, items_data[num_item][2][field_name]))
+            items[position] = cls.set_fixtures_item_field(items[position], field_name, None)
+        return cls.set_fixtures_items(fixtures, items), deferred_fks, levels
+
+    @classmethod
+    def prefetch_natural_keys(cls, fixtures, saved_objects, using='default'):
+        """
+            Load the objects referenced by natural key in the fixtures, and the objects of the
+            natural keys of the fixtures without primary key, into saved_objects, with
+            one query per model (and BATCH_SIZE natural keys). The manager of the model has to
+            implement get_by_natural_keys(natural_keys), returning the objects with these natural
+            keys, e.g. return self.filter(slug__in=[slug for slug, in natural_keys]). There is not
+            a generic fallback (the fields of a natural key are unknown), the natural keys of the
+            other models are resolved by get_by_natural_key, with one query per natural key.
+        """
+        items_data = [cls.get_fixtures_item_data(item) for item in cls.get_fixtures_items(fixtures)]
+        models = []
+        models_natural_keys = {}
+        # The objects of the fixtures without primary key are searched by their natural keys too
+        for model, natural_keys in get_natural_key_references(items_data) + get_natural_keys(items_data):
+            if not model in models_natural_keys:
+                models.append(model)
+                models_natural_keys[model] = []
+            models_natural_keys[model].extend(natural_keys)
+        for model in models:
+            saved_objects.prefetch(model, models_natural_keys[model], using=using)
+
+    @classmethod
+    def update_deferred_fks(cls, deferred, using='default', saved_objects=None):
+        """
+            Given a list of (saved object, field name, reference), set the foreign keys with
+            one UPDATE per model and field. The references are primary keys or natural keys,
+            these are resolved with saved_objects if it is given
+        """
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        updates = {}
+        for obj, field_name, reference in deferred:
+            field = obj._meta.get_field(field_name)
+            related_model = field.rel.to
+            if isinstance(reference, (list, tuple)):
+                if saved_objects is not None and field.rel.field_name == related_model._meta.pk.name:
+                    value = saved_objects.get_pk(related_model, reference, using)
+                else:
+                    related = related_model._default_manager.db_manager(using).get_by_natural_key(*reference)
+                    value = getattr(related, field.rel.field_name)
+            else:
+                value = related_model._meta.get_field(field.rel.field_name).to_python(reference)
+            setattr(obj, field.attname, value)
+            updates.setdefault((obj.__class__, field), []).append((obj.pk, value))
+        # Every object has three parameters: WHEN pk THEN value and IN pk
+        chunk_size = BATCH_SIZE
+        max_query_params = get_max_query_params(connection)
+        if max_query_params is not None:
+            chunk_size = min(chunk_size, max_query_params // 3)
+        for (model, field), values in updates.items():
+            pk_field = model._meta.pk
+            for chunk in chunked(values, chunk_size):
+                sql = 'UPDATE %s SET %s = CASE %s %s END WHERE %s IN (%s)' % (
+                    qn(model._meta.db_table), qn(field.column), qn(pk_field.column),
+                    ' '.join(['WHEN %s THEN %s'] * len(chunk)),
+                    qn(pk_field.column), ', '.join(['%s'] * len(chunk)))
+                params = []
+                for pk, value in chunk:
+                    params.extend([pk_field.get_db_prep_value(pk, connection),
+                                   field.get_db_prep_value(value, connection)])
+                params.extend(pk_field.get_db_prep_value(pk, connection) for pk, value in chunk)
+                connection.cursor().execute(sql, params)
+
+    @classmethod
+    def get_fixtures_items(cls, fixtures):
+        """
+            Return the list of the objects of the fixtures, in the format of pretreatment_fixture
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def get_fixtures_item_data(cls, item):
+        """
+            Return (model label, primary key or None, fields) of an object of the fixtures. The
+            values of the relations are primary keys or natural keys (lists)
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def set_fixtures_items(cls, fixtures, items):
+        """
+            Return the fixtures with these objects
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def set_fixtures_item_field(cls, item, field_name, value):
+        """
+            Return the object of the fixtures with this value (a primary key or None) in the field
+        """
+        raise NotImplementedError
+
     @classmethod
     def deserialize_reorder(cls, fixtures, num_item, num_reorder):
         raise NotImplementedError
@@ -404,11 +1598,21 @@ class Deserializer(BaseMetaWalkClassProvider):
         raise NotImplementedError
 
 
+def check_cancelled(cancelled):
+    if cancelled is not None and cancelled.is_set():
+        raise SerializationCancelled('The serialization has been cancelled')
+
+
 def serializer(format, *args, **kwargs):
     s = get_serializer(format)
     return s.serialize(*args, **kwargs)
 
 
+def serializer_many(format, *args, **kwargs):
+    s = get_serializer(format)
+    return s.serialize_many(*args, **kwargs)
+
+
 def deserializer(format, *args, **kwargs):
     d = get_deserializer(format)
     return d.deserialize(*args, **kwargs)
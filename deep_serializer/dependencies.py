@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 by Pablo Martín <goinnn@gmail.com>
+#
+# This software is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.utils.encoding import smart_text
+
+from deep_serializer.utils import get_model_label, get_model_relations, get_reference_key
+
+
+def sort_by_dependencies(items_data, two_phase=False, bulk=False):
+    """
+        Given the objects of some fixtures, a list of (model label, primary key or None, fields),
+        return the indexes of the objects sorted by dependencies: every object after the objects
+        of the fixtures that it references by a foreign key or a many to many relation. The other
+        objects keep the order of the fixtures. The objects are identified by their primary key
+        or by their natural key, calculated with the referenced objects of the fixtures.
+        Return too the references to defer, (index, field name): with two_phase the objects of
+        a cycle are sorted by the references that can not be null, and the nullable foreign keys
+        to the next objects are deferred. With bulk the objects are sorted by levels, an object
+        in a level after the levels of the objects that it references, and the level of every
+        object is returned too (None without bulk).
+    """
+    references = get_references(items_data)
+    dependencies = [[num_related_item for field, num_related_item, deferrable in item_references]
+                    for item_references in references]
+    # The objects of a cycle (e.g. a website and its initial page) keep the order of the fixtures
+    components = get_cycles(dependencies)
+    num_components = {}
+    for num_component, component in enumerate(components):
+        for num_item in component:
+            num_components[num_item] = num_component
+    components_dependencies = []
+    for num_component, component in enumerate(components):
+        component_dependencies = set()
+        for num_item in component:
+            component_dependencies.update(num_components[num_related_item]
+                                          for num_related_item in dependencies[num_item])
+        component_dependencies.discard(num_component)
+        components_dependencies.append(sorted(component_dependencies))
+    order = []
+    for num_component in topological_sort(components_dependencies):
+        component = components[num_component]
+        if two_phase and len(component) > 1:
+            component = sort_cycle(component, references)
+        order.extend(component)
+    positions = dict((num_item, position) for position, num_item in enumerate(order))
+    deferred = []
+    if two_phase:
+        for num_item in order:
+            for field, num_related_item, deferrable in references[num_item]:
+                if deferrable and positions[num_related_item] > positions[num_item]:
+                    deferred.append((num_item, field.name))
+    if not bulk:
+        return order, deferred, None
+    levels = {}
+    for num_item in order:
+        # The references to the next objects (of a cycle) are not used
+        levels[num_item] = max([levels[num_related_item] + 1
+                                for field, num_related_item, deferrable in references[num_item]
+                                if positions[num_related_item] < positions[num_item]] or [0])
+    order = sorted(order, key=lambda num_item: (levels[num_item], positions[num_item]))
+    return order, deferred, [levels[num_item] for num_item in order]
+
+
+def get_references(items_data):
+    """
+        Return for every object the references to the objects of the fixtures,
+        a list of (field, index of the related object, the reference can be deferred)
+    """
+    items_models = [models.get_model(*model_label.split('.')) for model_label, pk, fields in items_data]
+    keys = {}
+    for num_item, (model_label, pk, fields) in enumerate(items_data):
+        if pk is not None:
+            keys[(model_label, smart_text(pk))] = num_item
+    if has_natural_key_references(items_data, items_models):
+        add_natural_keys(items_data, items_models, keys)
+    references = []
+    for num_item, (model_label, pk, fields) in enumerate(items_data):
+        item_references = []
+        references.append(item_references)
+        if items_models[num_item] is None:
+            # The deserializer raises the exception
+            continue
+        relations = get_model_relations(items_models[num_item])
+        for field in relations.fks + relations.m2ms:
+            value = fields.get(field.name, None)
+            if value is None:
+                continue
+            if field in relations.m2ms:
+                field_references = value
+                deferrable = False
+            else:
+                field_references = [value]
+                deferrable = field.null
+            related_label = get_model_label(field.rel.to)
+            for reference in field_references:
+                num_related_item = keys.get((related_label, get_reference_key(reference)), None)
+                if num_related_item is not None and num_related_item != num_item:
+                    item_references.append((field, num_related_item, deferrable))
+    return references
+
+
+def has_natural_key_references(items_data, items_models):
+    """
+        Return if a foreign key or a many to many relation of the objects of the
+        fixtures references an object by its natural key
+    """
+    for num_item, (model_label, pk, fields) in enumerate(items_data):
+        if items_models[num_item] is None:
+            continue
+        relations = get_model_relations(items_models[num_item])
+        for field in relations.fks + relations.m2ms:
+            value = fields.get(field.name, None)
+            if value is None:
+                continue
+            if field in relations.m2ms:
+                field_references = value
+            else:
+                field_references = [value]
+            for reference in field_references:
+                if isinstance(reference, (list, tuple)):
+                    return True
+    return False
+
+
+def get_natural_key_references(items_data):
+    """
+        Return the natural keys referenced by the foreign keys and the many to many relations
+        of the objects of the fixtures, grouped by model: a list of (model, natural keys)
+    """
+    models_natural_keys = {}
+    for model_label, pk, fields in items_data:
+        model = models.get_model(*model_label.split('.'))
+        if model is None:
+            continue
+        relations = get_model_relations(model)
+        for field in relations.fks + relations.m2ms:
+            value = fields.get(field.name, None)
+            if value is None:
+                continue
+            if field in relations.m2ms:
+                field_references = value
+            elif field.rel.field_name == field.rel.to._meta.pk.name:
+                field_references = [value]
+            else:
+                continue
+            model_natural_keys = models_natural_keys.setdefault(field.rel.to, {})
+            for reference in field_references:
+                if isinstance(reference, (list, tuple)):
+                    model_natural_keys.setdefault(get_reference_key(reference), reference)
+    return [(model, list(models_natural_keys[model].values()))
+            for model in sorted(models_natural_keys, key=get_model_label)]
+
+
+def get_natural_keys(items_data):
+    """
+        Return the natural keys of the objects of the fixtures without primary key (calculated
+        like add_natural_keys), grouped by model: a list of (model, natural keys)
+    """
+    items_models = [models.get_model(*model_label.split('.')) for model_label, pk, fields in items_data]
+    keys = {}
+    add_natural_keys(items_data, items_models, keys)
+    models_natural_keys = {}
+    for (model_label, natural_key), num_item in sorted(keys.items(), key=lambda item: item[1]):
+        if items_data[num_item][1] is None:
+            models_natural_keys.setdefault(items_models[num_item], []).append(natural_key)
+    return [(model, models_natural_keys[model])
+            for model in sorted(models_natural_keys, key=get_model_label)]
+
+
+def sort_cycle(component, references):
+    """
+        Sort the objects of a cycle by the references that can not be deferred
+    """
+    positions = dict((num_item, position) for position, num_item in enumerate(component))
+    dependencies = [[positions[num_related_item]
+                     for field, num_related_item, deferrable in references[num_item]
+                     if not deferrable and num_related_item in positions]
+                    for num_item in component]
+    return [component[position] for position in topological_sort(dependencies)]
+
+
+def get_cycles(dependencies):
+    """
+        Return the strongly connected components of the dependencies graph (the cycles, or
+        an object without cycle), sorted by their first object. Every component is sorted.
+    """
+    dependents = [[] for num_item in dependencies]
+    for num_item, item_dependencies in enumerate(dependencies):
+        for num_dependency in item_dependencies:
+            dependents[num_dependency].append(num_item)
+    num_components = [None] * len(dependencies)
+    components = []
+    # Kosaraju: the objects in inverse order of finishing, every object reaches its dependents
+    for num_item in reversed(topological_sort(dependencies)):
+        if num_components[num_item] is not None:
+            continue
+        component = []
+        num_components[num_item] = len(components)
+        stack = [num_item]
+        while stack:
+            num_current_item = stack.pop()
+            component.append(num_current_item)
+            for num_dependent in dependents[num_current_item]:
+                if num_components[num_dependent] is None:
+                    num_components[num_dependent] = len(components)
+                    stack.append(num_dependent)
+        components.append(sorted(component))
+    return sorted(components)
+
+
+def topological_sort(dependencies):
+    """
+        Depth-first sort with an explicit stack, every item after its dependencies
+        (the items of a cycle are sorted from the first one found)
+    """
+    NEW, VISITING, SORTED = 0, 1, 2
+    status = [NEW] * len(dependencies)
+    order = []
+    for num_item in range(len(dependencies)):
+        if status[num_item] != NEW:
+            continue
+        status[num_item] = VISITING
+        stack = [(num_item, iter(dependencies[num_item]))]
+        while stack:
+            num_current_item, item_dependencies = stack[-1]
+            for num_dependency in item_dependencies:
+                if status[num_dependency] == NEW:
+                    status[num_dependency] = VISITING
+                    stack.append((num_dependency, iter(dependencies[num_dependency])))
+                    break
+            else:
+                stack.pop()
+                status[num_current_item] = SORTED
+                order.append(num_current_item)
+    return order
+
+
+def add_natural_keys(items_data, items_models, keys):
+    """
+        Add to keys the natural keys of the objects, (model label, natural key) -> index.
+        The natural keys are calculated with unsaved objects, the models are treated in the
+        order of natural_key.dependencies, so the related objects of a natural key are built before
+        (by natural key or by primary key), and they are not queried.
+    """
+    instances = {}
+    for model in sort_models(set(model for model in items_models
+                                 if model is not None and get_model_relations(model).has_natural_key)):
+        model_label = get_model_label(model)
+        for num_item, (item_model_label, pk, fields) in enumerate(items_data):
+            if items_models[num_item] is not model:
+                continue
+            instance = build_instance(model, pk, fields, instances)
+            if pk is not None:
+                instances.setdefault((model_label, smart_text(pk)), instance)
+            try:
+                natural_key = get_reference_key(instance.natural_key())
+            except (ObjectDoesNotExist, AttributeError):
+                # The natural key uses objects out of the fixtures (or without them)
+                continue
+            keys.setdefault((model_label, natural_key), num_item)
+            instances.setdefault((model_label, natural_key), instance)
+
+
+def sort_models(natural_key_models):
+    """
+        Sort the models with natural key, every model after the models of its natural_key.dependencies
+    """
+    natural_key_models = sorted(natural_key_models, key=get_model_label)
+    labels = dict((get_model_label(model), num_model) for num_model, model in enumerate(natural_key_models))
+    dependencies = [[labels[dependency.lower()]
+                     for dependency in getattr(model.natural_key, 'dependencies', ())
+                     if dependency.lower() in labels]
+                    for model in natural_key_models]
+    return [natural_key_models[num_model] for num_model in topological_sort(dependencies)]
+
+
+def build_instance(model, pk, fields, instances):
+    obj = model()
+    if pk is not None:
+        obj.pk = model._meta.pk.to_python(pk)
+    for field in model._meta.fields:
+        if not field.name in fields:
+            continue
+        value = fields[field.name]
+        if field.rel is None:
+            setattr(obj, field.attname, field.to_python(value))
+        elif isinstance(value, (list, tuple)):
+            related = instances.get((get_model_label(field.rel.to), get_reference_key(value)), None)
+            if related is not None:
+                setattr(obj, field.get_cache_name(), related)
+        elif value is not None:
+            related_field = field.rel.to._meta.get_field(field.rel.field_name)
+            setattr(obj, field.attname, related_field.to_python(value))
+            if related_field.primary_key:
+                related = instances.get((get_model_label(field.rel.to), smart_text(value)), None)
+                if related is not None:
+                    setattr(obj, field.get_cache_name(), related)
+    return obj
@@ -23,6 +23,14 @@ class DeepSerializerDoesNotExist(Exception):
     pass
 
 
+class SerializationCancelled(Exception):
+    pass
+
+
+class SerializationBudgetExceeded(Exception):
+    pass
+
+
 def update_the_serializer(obj, field_name):
     msg = 'Please update the serializer this class: %s has not define the behavior to this relation: %s' % (obj.__class__.__name__, field_name)
     raise DeepSerializerDoesNotExist(msg)
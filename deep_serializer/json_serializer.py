@@ -38,6 +38,14 @@ class Deserializer(python_serializer.Deserializer):
 
     format = 'json'
 
+    @classmethod
+    def get_fixtures_items(cls, fixtures):
+        return json.loads(fixtures)
+
+    @classmethod
+    def set_fixtures_items(cls, fixtures, items):
+        return dumps(items)
+
     @classmethod
     def deserialize_reorder(cls, fixtures, num_item, num_reorder):
         fixtures_python = json.loads(fixtures)
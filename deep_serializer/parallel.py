@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 by Pablo Martín <goinnn@gmail.com>
+#
+# This software is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from xml.dom import minidom
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models
+from django.db.transaction import TransactionManagementError
+from django.db.models.query import QuerySet
+from django.utils.encoding import smart_text
+from django.utils.six import PY3, StringIO
+
+from deep_serializer.base import get_serializer
+from deep_serializer.exceptions import DeepSerializerDoesNotExist
+from deep_serializer.settings import USE_INTERNAL_SERIALIZERS
+from deep_serializer.utils import get_model_label
+
+if USE_INTERNAL_SERIALIZERS:
+    from deep_serializer.serializers.json import DjangoJSONEncoder
+else:
+    from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+try:
+    import yaml
+    if USE_INTERNAL_SERIALIZERS:
+        from deep_serializer.serializers.pyyaml import DjangoSafeDumper
+    else:
+        from django.core.serializers.pyyaml import DjangoSafeDumper
+except ImportError:
+    yaml = None
+
+MERGE_FORMATS = ('python', 'json', 'xml')
+if yaml is not None:
+    MERGE_FORMATS += ('yaml', )
+
+
+def serializer_parallel(format, initial_objs,
+                        max_workers=None,
+                        num_shards=None,
+                        shard_dir=None,
+                        indent=None,
+                        stream=None,
+                        executor=None,
+                        **kwargs):
+    """
+        Serialize the initial objects (a queryset or a list of objects) in shards,
+        every shard in a process with its own database connection. Every worker
+        writes the fixtures of its shard into a file of shard_dir (a temporary
+        directory by default), and these are merged in one fixtures without
+        repeated objects. The kwargs are the options of serialize_many, they
+        have to be picklable.
+        Without executor the connections of this process are closed before
+        forking the workers, so it can not run inside a transaction (it raises
+        TransactionManagementError).
+    """
+    if format not in MERGE_FORMATS:
+        raise DeepSerializerDoesNotExist(format)
+    if executor is None and ProcessPoolExecutor is None:
+        raise ImproperlyConfigured('The parallel serialization needs concurrent.futures (pip install futures)')
+    if executor is None:
+        for connection in connections.all():
+            if in_transaction(connection):
+                raise TransactionManagementError('The parallel serialization closes the connections, '
+                                                 'it can not run inside a transaction')
+    max_workers = max_workers or multiprocessing.cpu_count()
+    shards = split_in_shards(get_roots(initial_objs), num_shards or max_workers)
+    remove_shard_dir = shard_dir is None and format != 'python'
+    if remove_shard_dir:
+        shard_dir = tempfile.mkdtemp(prefix='deep_serializer')
+    try:
+        shard_paths = [format != 'python' and os.path.join(shard_dir, 'shard-%s.%s' % (num_shard, format)) or None
+                       for num_shard in range(len(shards))]
+        if format == 'xml' and indent is not None:
+            # The objects of the shards are merged as they are
+            kwargs['indent'] = indent
+        if executor is None:
+            # The workers are forked, they can not share the connections of this process.
+            # These are closed here and every worker opens its own connections
+            for connection in connections.all():
+                connection.close()
+            with ProcessPoolExecutor(max_workers=max_workers) as process_executor:
+                shard_fixtures = serialize_shards(process_executor, format, shards, shard_paths, kwargs)
+        else:
+            shard_fixtures = serialize_shards(executor, format, shards, shard_paths, kwargs)
+        return merge_fixtures(format, shard_fixtures, indent=indent, stream=stream)
+    finally:
+        if remove_shard_dir:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+def in_transaction(connection):
+    if hasattr(connection, 'in_atomic_block'):
+        return connection.in_atomic_block
+    # Django < 1.6
+    return connection.is_managed()
+
+
+def get_roots(initial_objs):
+    if isinstance(initial_objs, QuerySet):
+        model_label = get_model_label(initial_objs.model)
+        return [(model_label, pk) for pk in initial_objs.values_list('pk', flat=True)]
+    return [(get_model_label(initial_obj.__class__), initial_obj.pk) for initial_obj in initial_objs]
+
+
+def split_in_shards(roots, num_shards):
+    """
+        Split the roots in num_shards consecutive shards, the roots near
+        (e.g. ordered by primary key) are usually related with the same objects
+    """
+    shard_size = max(1, (len(roots) + num_shards - 1) // num_shards)
+    return [roots[i:i + shard_size] for i in range(0, len(roots), shard_size)]
+
+
+def serialize_shards(executor, format, shards, shard_paths, kwargs):
+    futures = [executor.submit(serialize_shard, format, shard, shard_path, **kwargs)
+               for shard, shard_path in zip(shards, shard_paths)]
+    return [future.result() for future in futures]
+
+
+def serialize_shard(format, shard, shard_path=None, **kwargs):
+    """
+        Serialize the roots of a shard, a list of (model label, primary key), and
+        write the fixtures into shard_path. With the python format the fixtures are returned
+    """
+    objs = {}
+    for model_label, pk in shard:
+        objs.setdefault(model_label, []).append(pk)
+    for model_label, pks in objs.items():
+        model = models.get_model(*model_label.split('.'))
+        objs[model_label] = model._default_manager.in_bulk(pks)
+    initial_objs = [objs[model_label][pk] for model_label, pk in shard
+                    if pk in objs[model_label]]
+    serializer = get_serializer(format)
+    if shard_path is None:
+        return serializer.serialize_many(initial_objs, **kwargs)
+    with open_shard(shard_path, 'w') as shard_stream:
+        serializer.serialize_many(initial_objs, stream=shard_stream, **kwargs)
+    return shard_path
+
+
+def open_shard(shard_path, mode='r'):
+    """
+        Open a shard file with the encoding of the fixtures (utf-8), not the encoding of the locale
+    """
+    if PY3:
+        return io.open(shard_path, mode, encoding='utf-8')
+    # The serializers of Python 2 write utf-8 bytes
+    return open(shard_path, mode + 'b')
+
+
+def merge_fixtures(format, shard_fixtures, indent=None, stream=None):
+    """
+        Merge the fixtures of several shards (the paths of the shard files, or the
+        fixtures with the python format) in one fixtures. An object in several shards
+        (model and primary key, or all its fields without primary key) is kept once,
+        in the first shard with it.
+    """
+    keys = set()
+    items = []
+    for fixtures in shard_fixtures:
+        for item in load_fixture_items(format, fixtures):
+            key = get_fixture_item_key(format, item)
+            if key in keys:
+                continue
+            keys.add(key)
+            items.append(item)
+    if format == 'python':
+        return items
+    return_value = stream is None
+    if return_value:
+        stream = StringIO()
+    if format == 'xml':
+        # Like the XML serializer, with the objects of the shards
+        stream.write('<?xml version="1.0" encoding="utf-8"?>\n<django-objects version="1.0">')
+        for item in items:
+            if indent is not None:
+                stream.write('\n' + ' ' * indent)
+            stream.write(item.toxml())
+        if indent is not None:
+            stream.write('\n')
+        stream.write('</django-objects>')
+    elif format == 'yaml':
+        yaml.dump(items, stream, Dumper=DjangoSafeDumper, default_flow_style=False)
+    else:
+        json.dump(items, stream, cls=DjangoJSONEncoder, indent=indent)
+    if return_value:
+        return stream.getvalue()
+
+
+def load_fixture_items(format, fixtures):
+    if format == 'python':
+        return fixtures
+    with open_shard(fixtures) as shard_stream:
+        if format == 'xml':
+            root = minidom.parse(shard_stream).documentElement
+            return [node for node in root.childNodes if node.nodeName == 'object']
+        elif format == 'yaml':
+            return yaml.load(shard_stream, Loader=yaml.SafeLoader) or []
+        return json.load(shard_stream)
+
+
+def get_fixture_item_key(format, item):
+    if format == 'xml':
+        if item.hasAttribute('pk'):
+            return (item.getAttribute('model'), item.getAttribute('pk'))
+        return (item.getAttribute('model'), item.toxml())
+    if 'pk' in item:
+        return (item['model'], smart_text(item['pk']))
+    return (item['model'], json.dumps(item['fields'], cls=DjangoJSONEncoder, sort_keys=True))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 by Pablo Martín <goinnn@gmail.com>
+#
+# This software is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+
+from deep_serializer.api import BaseMetaWalkClass, WALKING_STOP
+from deep_serializer.exceptions import DeepSerializerDoesNotExist
+from deep_serializer.utils import get_model_relations
+
+
+def is_static_walking_class(meta_class):
+    walking_into_class = meta_class.walking_into_class.__func__
+    return (meta_class.static_walking or
+            walking_into_class is BaseMetaWalkClass.walking_into_class.__func__)
+
+
+class WalkPlan(dict):
+    """
+        The walking classes of a serialization (model -> meta walk class) with
+        the walking status of every relation with a walking rule or of a static walking class.
+        These are calculated the first time that an object of the model is walked,
+        and reused by all the serializations with this plan. It is immutable.
+    """
+
+    def __init__(self, walking_classes=None):
+        super(WalkPlan, self).__init__(walking_classes or {})
+        self._walking_status = {}
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('A walk plan is immutable')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self), ))
+
+    def get_walking_status(self, model, field_name):
+        """
+            Return the walking status of the relation field_name of the model,
+            or None if this has to be asked to the walking class for every object
+        """
+        try:
+            model_walking_status = self._walking_status[model]
+        except KeyError:
+            model_walking_status = self._walking_status[model] = self.compile_model(model)
+        return model_walking_status.get(field_name, None)
+
+    def compile_model(self, model):
+        model_walking_status = {}
+        meta_class = self.get(model, BaseMetaWalkClass)
+        walking_rules = meta_class.get_walking_rules()
+        static = is_static_walking_class(meta_class)
+        relations = get_model_relations(model)
+        related_models = [(field.name, field.rel.to) for field in relations.fks + relations.m2ms]
+        related_models.extend((relation.name, relation.model) for relation in relations.reverses)
+        for field_name, related_model in related_models:
+            if related_model not in self:
+                model_walking_status[field_name] = WALKING_STOP
+            elif field_name in walking_rules:
+                model_walking_status[field_name] = walking_rules[field_name]
+            elif static:
+                try:
+                    model_walking_status[field_name] = meta_class.walking_into_class(None, None, field_name,
+                                                                                     related_model)
+                except DeepSerializerDoesNotExist:
+                    # The serializer will raise the exception with the object
+                    pass
+        return model_walking_status
+
+
+def compile_walk_plan(walking_classes):
+    return WalkPlan(walking_classes)
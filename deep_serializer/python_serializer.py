@@ -34,6 +34,26 @@ class Deserializer(base.Deserializer):
 
     format = 'python'
 
+    @classmethod
+    def get_fixtures_items(cls, fixtures):
+        return fixtures
+
+    @classmethod
+    def get_fixtures_item_data(cls, item):
+        return (item['model'], item.get('pk', None), item['fields'])
+
+    @classmethod
+    def set_fixtures_items(cls, fixtures, items):
+        return items
+
+    @classmethod
+    def set_fixtures_item_field(cls, item, field_name, value):
+        fields = dict(item['fields'])
+        fields[field_name] = value
+        item = dict(item)
+        item['fields'] = fields
+        return item
+
     @classmethod
     def deserialize_reorder(cls, fixtures, num_item, num_reorder):
         num_items = len(fixtures)
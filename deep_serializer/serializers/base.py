@@ -6,6 +6,8 @@ import warnings
 from django.db import models
 from django.utils import six
 
+from deep_serializer.utils import IdentityMap
+
 class SerializerDoesNotExist(KeyError):
     """The requested serializer was not found."""
     pass
@@ -41,6 +43,9 @@ class Serializer(object):
                 PendingDeprecationWarning)
         self.use_natural_foreign_keys = options.pop('use_natural_foreign_keys', False) or self.use_natural_keys
         self.use_natural_primary_keys = options.pop('use_natural_primary_keys', False)
+        self.identity_map = options.pop('identity_map', None)
+        if self.identity_map is None:
+            self.identity_map = IdentityMap()
 
         self.start_serialization()
         self.first = True
@@ -109,6 +114,53 @@ class Serializer(object):
         """
         raise NotImplementedError('subclasses of Serializer must provide an handle_m2m_field() method')
 
+    def get_fk_natural_key(self, obj, field):
+        """
+        Return the natural key of the object related with obj by a ForeignKey.
+        The natural key is looked for in the identity map (the walked and
+        loaded objects) before loading it, so every object is loaded once.
+        A related object set in obj (e.g. by pre_serialize) is used instead.
+        """
+        value = getattr(obj, field.get_attname())
+        if value is None:
+            return None
+        related_model = field.rel.to
+        if (hasattr(obj, field.get_cache_name()) or
+                field.rel.field_name != related_model._meta.pk.name):
+            related = getattr(obj, field.name)
+            return related and related.natural_key() or None
+        natural_key = self.identity_map.get_natural_key(related_model, value)
+        if natural_key is None:
+            natural_key = self.identity_map.add_natural_key(getattr(obj, field.name))
+        return natural_key
+
+    def get_m2m_natural_key(self, related):
+        """
+        Return the natural key of an object of a ManyToManyField, from the
+        identity map if the object was walked.
+        """
+        natural_key = self.identity_map.get_natural_key(related.__class__, related._get_pk_val())
+        if natural_key is None:
+            natural_key = related.natural_key()
+        return natural_key
+
+    def get_m2m_values(self, obj, field):
+        """
+        Return the related objects of a ManyToManyField. If these were
+        prefetched (e.g. by the walk) the database is not queried. With
+        natural keys, the natural keys of the related objects are added to
+        the identity map.
+        """
+        related_manager = getattr(obj, field.name)
+        if field.name in getattr(obj, '_prefetched_objects_cache', {}):
+            related_objects = related_manager.all()
+        else:
+            related_objects = related_manager.iterator()
+        for related in related_objects:
+            if self.use_natural_foreign_keys:
+                self.identity_map.add_natural_key(related)
+            yield related
+
     def getvalue(self):
         """
         Return the fully serialized queryset (or None if the output stream is
@@ -176,19 +228,25 @@ class DeserializedObject(object):
         # the m2m data twice.
         self.m2m_data = None
 
-def build_instance(Model, data, db):
+def build_instance(Model, data, db, saved_objects=None):
     """
     Build a model instance.
 
     If the model instance doesn't have a primary key and the model supports
-    natural keys, try to retrieve it from the database.
+    natural keys, try to retrieve it from the database. With saved_objects
+    the related objects and the primary key are looked for in it before.
     """
     obj = Model(**data)
+    if saved_objects is not None:
+        saved_objects.set_related_objs(obj)
     if (obj.pk is None and hasattr(Model, 'natural_key') and
             hasattr(Model._default_manager, 'get_by_natural_key')):
         natural_key = obj.natural_key()
         try:
-            obj.pk = Model._default_manager.db_manager(db).get_by_natural_key(*natural_key).pk
+            if saved_objects is not None:
+                obj.pk = saved_objects.get_pk(Model, natural_key, db)
+            else:
+                obj.pk = Model._default_manager.db_manager(db).get_by_natural_key(*natural_key).pk
         except Model.DoesNotExist:
             pass
     return obj
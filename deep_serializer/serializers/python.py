@@ -54,24 +54,19 @@ class Serializer(base.Serializer):
             self._current[field.name] = field.value_to_string(obj)
 
     def handle_fk_field(self, obj, field):
-        if self.use_natural_foreign_keys and hasattr(field.rel.to, 'natural_key'):
-            related = getattr(obj, field.name)
-            if related:
-                value = related.natural_key()
-            else:
-                value = None
-        else:
-            value = getattr(obj, field.get_attname())
+        value = getattr(obj, field.get_attname())
+        if value is not None and self.use_natural_foreign_keys and hasattr(field.rel.to, 'natural_key'):
+            value = self.get_fk_natural_key(obj, field)
         self._current[field.name] = value
 
     def handle_m2m_field(self, obj, field):
         if field.rel.through._meta.auto_created:
             if self.use_natural_foreign_keys and hasattr(field.rel.to, 'natural_key'):
-                m2m_value = lambda value: value.natural_key()
+                m2m_value = self.get_m2m_natural_key
             else:
                 m2m_value = lambda value: smart_text(value._get_pk_val(), strings_only=True)
             self._current[field.name] = [m2m_value(related)
-                               for related in getattr(obj, field.name).iterator()]
+                               for related in self.get_m2m_values(obj, field)]
 
     def getvalue(self):
         return self.objects
@@ -86,6 +81,7 @@ def Deserializer(object_list, **options):
     """
     db = options.pop('using', DEFAULT_DB_ALIAS)
     ignore = options.pop('ignorenonexistent', False)
+    saved_objects = options.pop('saved_objects', None)
 
     models.get_apps()
     for d in object_list:
@@ -114,6 +110,8 @@ def Deserializer(object_list, **options):
                 if hasattr(field.rel.to._default_manager, 'get_by_natural_key'):
                     def m2m_convert(value):
                         if hasattr(value, '__iter__') and not isinstance(value, six.text_type):
+                            if saved_objects is not None:
+                                return saved_objects.get_pk(field.rel.to, value, db)
                             return field.rel.to._default_manager.db_manager(db).get_by_natural_key(*value).pk
                         else:
                             return smart_text(field.rel.to._meta.pk.to_python(value))
@@ -126,12 +124,15 @@ def Deserializer(object_list, **options):
                 if field_value is not None:
                     if hasattr(field.rel.to._default_manager, 'get_by_natural_key'):
                         if hasattr(field_value, '__iter__') and not isinstance(field_value, six.text_type):
-                            obj = field.rel.to._default_manager.db_manager(db).get_by_natural_key(*field_value)
-                            value = getattr(obj, field.rel.field_name)
-                            # If this is a natural foreign key to an object that
-                            # has a FK/O2O as the foreign key, use the FK value
-                            if field.rel.to._meta.pk.rel:
-                                value = value.pk
+                            if saved_objects is not None and field.rel.field_name == field.rel.to._meta.pk.name:
+                                value = saved_objects.get_pk(field.rel.to, field_value, db)
+                            else:
+                                obj = field.rel.to._default_manager.db_manager(db).get_by_natural_key(*field_value)
+                                value = getattr(obj, field.rel.field_name)
+                                # If this is a natural foreign key to an object that
+                                # has a FK/O2O as the foreign key, use the FK value
+                                if field.rel.to._meta.pk.rel:
+                                    value = value.pk
                         else:
                             value = field.rel.to._meta.get_field(field.rel.field_name).to_python(field_value)
                         data[field.attname] = value
@@ -144,7 +145,7 @@ def Deserializer(object_list, **options):
             else:
                 data[field.name] = field.to_python(field_value)
 
-        obj = base.build_instance(Model, data, db)
+        obj = base.build_instance(Model, data, db, saved_objects)
         yield base.DeserializedObject(obj, m2m_data)
 
 def _get_model(model_identifier):
@@ -87,18 +87,18 @@ class Serializer(base.Serializer):
         """
         self._start_relational_field(field)
         related_att = getattr(obj, field.get_attname())
-        if related_att is not None:
-            if self.use_natural_foreign_keys and hasattr(field.rel.to, 'natural_key'):
-                related = getattr(obj, field.name)
-                # If related object has a natural key, use it
-                related = related.natural_key()
-                # Iterable natural keys are rolled out as subelements
-                for key_value in related:
-                    self.xml.startElement("natural", {})
-                    self.xml.characters(smart_text(key_value))
-                    self.xml.endElement("natural")
-            else:
-                self.xml.characters(smart_text(related_att))
+        related = None
+        if related_att is not None and self.use_natural_foreign_keys and hasattr(field.rel.to, 'natural_key'):
+            # If related object has a natural key, use it
+            related = self.get_fk_natural_key(obj, field)
+        if related is not None:
+            # Iterable natural keys are rolled out as subelements
+            for key_value in related:
+                self.xml.startElement("natural", {})
+                self.xml.characters(smart_text(key_value))
+                self.xml.endElement("natural")
+        elif related_att is not None:
+            self.xml.characters(smart_text(related_att))
         else:
             self.xml.addQuickElement("None")
         self.xml.endElement("field")
@@ -114,7 +114,7 @@ class Serializer(base.Serializer):
             if self.use_natural_foreign_keys and hasattr(field.rel.to, 'natural_key'):
                 # If the objects in the m2m have a natural key, use it
                 def handle_m2m(value):
-                    natural = value.natural_key()
+                    natural = self.get_m2m_natural_key(value)
                     # Iterable natural keys are rolled out as subelements
                     self.xml.startElement("object", {})
                     for key_value in natural:
@@ -127,7 +127,7 @@ class Serializer(base.Serializer):
                     self.xml.addQuickElement("object", attrs={
                         'pk' : smart_text(value._get_pk_val())
                     })
-            for relobj in getattr(obj, field.name).iterator():
+            for relobj in self.get_m2m_values(obj, field):
                 handle_m2m(relobj)
 
             self.xml.endElement("field")
@@ -153,6 +153,7 @@ class Deserializer(base.Deserializer):
         self.event_stream = pulldom.parse(self.stream, self._make_parser())
         self.db = options.pop('using', DEFAULT_DB_ALIAS)
         self.ignore = options.pop('ignorenonexistent', False)
+        self.saved_objects = options.pop('saved_objects', None)
 
     def _make_parser(self):
         """Create a hardened XML parser (no custom/external entities)."""
@@ -211,7 +212,7 @@ class Deserializer(base.Deserializer):
                     value = field.to_python(getInnerText(field_node).strip())
                 data[field.name] = value
 
-        obj = base.build_instance(Model, data, self.db)
+        obj = base.build_instance(Model, data, self.db, self.saved_objects)
 
         # Return a DeserializedObject so that the m2m data has a place to live.
         return base.DeserializedObject(obj, m2m_data)
@@ -229,6 +230,8 @@ class Deserializer(base.Deserializer):
                 if keys:
                     # If there are 'natural' subelements, it must be a natural key
                     field_value = [getInnerText(k).strip() for k in keys]
+                    if self.saved_objects is not None and field.rel.field_name == field.rel.to._meta.pk.name:
+                        return self.saved_objects.get_pk(field.rel.to, field_value, self.db)
                     obj = field.rel.to._default_manager.db_manager(self.db).get_by_natural_key(*field_value)
                     obj_pk = getattr(obj, field.rel.field_name)
                     # If this is a natural foreign key to an object that
@@ -254,6 +257,8 @@ class Deserializer(base.Deserializer):
                 if keys:
                     # If there are 'natural' subelements, it must be a natural key
                     field_value = [getInnerText(k).strip() for k in keys]
+                    if self.saved_objects is not None:
+                        return self.saved_objects.get_pk(field.rel.to, field_value, self.db)
                     obj_pk = field.rel.to._default_manager.db_manager(self.db).get_by_natural_key(*field_value).pk
                 else:
                     # Otherwise, treat like a normal PK value.
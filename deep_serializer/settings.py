@@ -26,3 +26,9 @@ if serialization_modules and isinstance(serialization_modules, dict):
             USE_INTERNAL_SERIALIZERS = False
 else:
     USE_INTERNAL_SERIALIZERS = False
+
+# Max number of values of every "field__in" query of the batched walk
+BATCH_SIZE = getattr(settings, 'DEEP_SERIALIZER_BATCH_SIZE', 500)
+
+# Max number of threads of the asynchronous serializations (deep_serializer.asynchronous)
+ASYNC_WORKERS = getattr(settings, 'DEEP_SERIALIZER_ASYNC_WORKERS', 4)
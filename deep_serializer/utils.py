@@ -14,10 +14,275 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this software.  If not, see <http://www.gnu.org/licenses/>.
 
+from django.utils import six
+from django.utils.encoding import smart_text
+
+from deep_serializer.exceptions import SerializationBudgetExceeded
+from deep_serializer.settings import BATCH_SIZE
+
+
+_model_relations = {}
+
+
+class ReverseRelation(object):
+
+    def __init__(self, related):
+        self.related = related
+        self.field = related.field
+        self.model = related.model
+        # The name used by the walking classes
+        self.name = related.field.related_query_name()
+        self.accessor_name = related.get_accessor_name()
+        self.multiple = related.field.rel.multiple
+        self.parent_attname = related.field.rel.get_related_field().attname
+
+
+class ModelRelations(object):
+    """
+        The relations of a model: foreign keys (and one2one), many to many and
+        reverse relations. These are calculated once per model, with the natural key
+        details: if the model has a natural key and the foreign keys used by it
+        (from natural_key.dependencies), to load them with select_related.
+    """
+
+    def __init__(self, model):
+        self.fks = tuple(field for field in model._meta.fields
+                         if hasattr(field.rel, 'to'))
+        self.m2ms = tuple(model._meta.many_to_many)
+        self.reverses = tuple(ReverseRelation(related)
+                              for related in model._meta.get_all_related_objects())
+        natural_key = getattr(model, 'natural_key', None)
+        self.has_natural_key = bool(natural_key and
+                                    getattr(getattr(model, 'objects', None), 'get_by_natural_key', None))
+        dependencies = set(dependency.lower() for dependency in getattr(natural_key, 'dependencies', ()))
+        self.natural_key_fields = tuple(field.name for field in self.fks
+                                        if get_model_label(field.rel.to) in dependencies)
+
+
+def get_model_relations(model):
+    try:
+        return _model_relations[model]
+    except KeyError:
+        model_relations = _model_relations[model] = ModelRelations(model)
+        return model_relations
+
+
+def get_model_label(model):
+    return ('%s.%s' % (model._meta.app_label, model._meta.object_name)).lower()
+
 
 def has_natural_key(content):
-    model = content.__class__
-    return getattr(content, 'natural_key', None) and getattr(model.objects, 'get_by_natural_key', None)
+    return get_model_relations(content.__class__).has_natural_key
+
+
+def get_content_key(content):
+    """
+        Key of an object in the serialization graph, (model, primary key).
+        It is hashable and it does not call Model.__eq__
+    """
+    return (content.__class__, content.pk)
+
+
+class ObjectKey(object):
+    """
+        Key of an object by its identity, e.g. of an object without primary key. It keeps
+        the object, so its id is not reused by another object while the key exists
+    """
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __hash__(self):
+        return id(self.obj)
+
+    def __eq__(self, other):
+        return isinstance(other, ObjectKey) and self.obj is other.obj
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class IdentityMap(object):
+    """
+        The natural keys of the objects of a serialization by their key (model, primary
+        key): the natural keys of the walked objects, saved before the hooks change them,
+        and of the referenced objects loaded from the database. The serializers resolve the
+        relations with it, so every object is loaded once. Only the natural keys are kept,
+        not the objects, so the memory does not grow with the objects of the graph.
+    """
+
+    def __init__(self):
+        self.natural_keys = {}
+
+    def add_natural_key(self, content):
+        """
+            Save the natural key of the object if it was not saved before, and return it
+            (None if the object does not have a natural key)
+        """
+        content_key = get_content_key(content)
+        if not content_key in self.natural_keys and has_natural_key(content):
+            self.natural_keys[content_key] = content.natural_key()
+        return self.natural_keys.get(content_key, None)
+
+    def get_natural_key(self, model, pk):
+        """
+            Return the natural key of the object, or None if it was not loaded
+        """
+        return self.natural_keys.get((model, pk), None)
+
+
+class SavedObjects(object):
+    """
+        The objects saved by a deserialization by their key (model, natural key), with
+        their primary keys, and the objects referenced by a natural key loaded from the
+        database. The internal deserializers resolve the natural keys of the relations
+        with it, so an object saved or loaded before is not queried again, and they set
+        the foreign keys to these objects, so natural_key() does not load them.
+        The natural keys prefetched and not found are not queried again.
+    """
+
+    def __init__(self):
+        self.pks = {}
+        self.objs = {}
+        self.missing = set()
+
+    def add(self, model, natural_key, pk, obj=None):
+        if pk is not None:
+            key = (model, get_reference_key(natural_key))
+            self.pks[key] = pk
+            self.missing.discard(key)
+            if obj is not None:
+                self.objs[(model, smart_text(pk))] = obj
+
+    def get_obj(self, model, pk):
+        """
+            Return the object of this primary key if it was saved or loaded, otherwise None
+        """
+        if pk is None:
+            return None
+        return self.objs.get((model, smart_text(pk)), None)
+
+    def get_pk(self, model, natural_key, using='default'):
+        """
+            Return the primary key of the object with this natural key, from the
+            saved objects or from the database (get_by_natural_key)
+        """
+        key = (model, get_reference_key(natural_key))
+        try:
+            return self.pks[key]
+        except KeyError:
+            if key in self.missing:
+                raise model.DoesNotExist("%s matching query does not exist." % model._meta.object_name)
+            obj = model._default_manager.db_manager(using).get_by_natural_key(*natural_key)
+            self.add(model, natural_key, obj.pk, obj)
+            return obj.pk
+
+    def prefetch(self, model, natural_keys, using='default'):
+        """
+            Load the objects of these natural keys with one query per BATCH_SIZE natural keys,
+            if the manager of the model has a get_by_natural_keys(natural_keys) method that
+            returns them. Otherwise they are loaded one by one when they are referenced.
+        """
+        manager = model._default_manager.db_manager(using)
+        if not hasattr(manager, 'get_by_natural_keys'):
+            return
+        keys = {}
+        for natural_key in natural_keys:
+            key = (model, get_reference_key(natural_key))
+            if not key in self.pks:
+                keys.setdefault(key, natural_key)
+        natural_keys = list(keys.values())
+        for natural_keys_chunk in chunked(natural_keys, BATCH_SIZE):
+            for obj in manager.get_by_natural_keys(natural_keys_chunk):
+                self.add(model, obj.natural_key(), obj.pk, obj)
+            for natural_key in natural_keys_chunk:
+                key = (model, get_reference_key(natural_key))
+                if not key in self.pks:
+                    self.missing.add(key)
+
+    def set_related_objs(self, obj):
+        """
+            Set the foreign keys (by primary key) of obj to the saved or loaded objects
+        """
+        for field in obj._meta.fields:
+            if field.rel is None or field.rel.field_name != field.rel.to._meta.pk.name:
+                continue
+            related = self.get_obj(field.rel.to, getattr(obj, field.attname))
+            if related is not None:
+                setattr(obj, field.get_cache_name(), related)
+
+
+class SerializationBudget(object):
+    """
+        The limits of a serialization: the max number of walked objects, the max
+        depth from the initial object and the max bytes of the fixtures. A limit
+        is None if there is not limit. The walk checks them when it finds an
+        object, so the serialization stops before loading more objects.
+    """
+
+    def __init__(self, max_objects=None, max_depth=None, max_bytes=None):
+        self.max_objects = max_objects
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+
+    def check_objects(self, num_objects):
+        if self.max_objects is not None and num_objects > self.max_objects:
+            raise SerializationBudgetExceeded('The serialization walks more than %s objects' % self.max_objects)
+
+    def check_depth(self, depth):
+        if self.max_depth is not None and depth > self.max_depth:
+            raise SerializationBudgetExceeded('The serialization walks deeper than %s relations' % self.max_depth)
+
+    def check_bytes(self, num_bytes):
+        if self.max_bytes is not None and num_bytes > self.max_bytes:
+            raise SerializationBudgetExceeded('The fixtures have more than %s bytes' % self.max_bytes)
+
+
+class BudgetStream(object):
+    """
+        A stream that counts the bytes written into it and checks the budget
+    """
+
+    def __init__(self, stream, budget):
+        self.stream = stream
+        self.budget = budget
+        self.num_bytes = 0
+
+    def write(self, data):
+        self.num_bytes += get_num_bytes(data)
+        self.budget.check_bytes(self.num_bytes)
+        self.stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def get_max_query_params(connection):
+    """
+        Return the max number of parameters of a query of the database, None if there is not limit
+    """
+    max_query_params = getattr(connection.features, 'max_query_params', None)
+    if max_query_params is None and not getattr(connection.features, 'supports_1000_query_parameters', True):
+        # SQLite before 3.32
+        max_query_params = 999
+    return max_query_params
+
+
+def get_num_bytes(data):
+    if isinstance(data, six.text_type):
+        return len(data.encode('utf-8'))
+    return len(data)
+
+
+def get_reference_key(reference):
+    if isinstance(reference, (list, tuple)):
+        return tuple(smart_text(value) for value in reference)
+    return smart_text(reference)
+
+
+def chunked(values, size):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
 
 
 def findnth(haystack, needle, n):
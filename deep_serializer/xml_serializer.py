@@ -14,13 +14,16 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this software.  If not, see <http://www.gnu.org/licenses/>.
 from django.contrib.contenttypes.models import ContentType
+from django.utils.encoding import smart_text
 
 from deep_serializer.settings import USE_INTERNAL_SERIALIZERS
 
 if USE_INTERNAL_SERIALIZERS:
     from deep_serializer.serializers.base import DeserializationError
+    from deep_serializer.serializers.xml_serializer import getInnerText
 else:
     from django.core.serializers.base import DeserializationError
+    from django.core.serializers.xml_serializer import getInnerText
 
 from deep_serializer import base
 from deep_serializer.utils import findnth
@@ -51,6 +54,60 @@ class Deserializer(base.Deserializer):
             return cls.calcule_item_end(fixtures, start, num_m2m=num_m2m_item)
         return end
 
+    @classmethod
+    def get_fixtures_items(cls, fixtures):
+        root = minidom.parseString(fixtures).documentElement
+        return [node for node in root.childNodes if node.nodeName == 'object']
+
+    @classmethod
+    def get_fixtures_item_data(cls, item):
+        fields = {}
+        for field_node in item.getElementsByTagName('field'):
+            field_name = field_node.getAttribute('name')
+            rel = field_node.getAttribute('rel')
+            if field_node.getElementsByTagName('None'):
+                fields[field_name] = None
+            elif rel == 'ManyToManyRel' or field_node.getElementsByTagName('object'):
+                fields[field_name] = [cls.get_fixtures_reference(object_node)
+                                      for object_node in field_node.getElementsByTagName('object')]
+            elif rel or field_node.getElementsByTagName('natural'):
+                # Like the deserializer, a field with natural nodes is a natural key (without rel too)
+                fields[field_name] = cls.get_fixtures_reference(field_node)
+            else:
+                fields[field_name] = getInnerText(field_node).strip()
+        return (item.getAttribute('model'), item.getAttribute('pk') or None, fields)
+
+    @classmethod
+    def get_fixtures_reference(cls, node):
+        if node.hasAttribute('pk'):
+            return node.getAttribute('pk')
+        natural_nodes = node.getElementsByTagName('natural')
+        if natural_nodes:
+            return [getInnerText(natural_node).strip() for natural_node in natural_nodes]
+        return getInnerText(node).strip()
+
+    @classmethod
+    def set_fixtures_items(cls, fixtures, items):
+        fixture_first_item_start = findnth(fixtures, TOKEN_OBJECT_START, 0)
+        last_item_index = findnth(fixtures, TOKEN_OBJECTS_END, 0)
+        return (fixtures[:fixture_first_item_start] +
+                ''.join(item.toxml() for item in items) +
+                fixtures[last_item_index:])
+
+    @classmethod
+    def set_fixtures_item_field(cls, item, field_name, value):
+        item = item.cloneNode(True)
+        for field_node in item.getElementsByTagName('field'):
+            if field_node.getAttribute('name') != field_name:
+                continue
+            while field_node.firstChild:
+                field_node.removeChild(field_node.firstChild)
+            if value is None:
+                field_node.appendChild(item.ownerDocument.createElement('None'))
+            else:
+                field_node.appendChild(item.ownerDocument.createTextNode(smart_text(value)))
+        return item
+
     @classmethod
     def deserialize_reorder(cls, fixtures, num_item, num_reorder):
         num_items = fixtures.count(TOKEN_OBJECT_START)
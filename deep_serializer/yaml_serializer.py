@@ -28,6 +28,14 @@ class Deserializer(python_serializer.Deserializer):
 
     format = 'yaml'
 
+    @classmethod
+    def get_fixtures_items(cls, fixtures):
+        return yaml.load(fixtures, Loader=yaml.SafeLoader)
+
+    @classmethod
+    def set_fixtures_items(cls, fixtures, items):
+        return yaml.dump(items)
+
     @classmethod
     def deserialize_reorder(cls, fixtures, num_item, num_reorder):
         fixtures_python = yaml.load(fixtures, Loader=yaml.SafeLoader)
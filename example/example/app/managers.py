@@ -14,6 +14,9 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this software.  If not, see <http://www.gnu.org/licenses/>.
 
+import functools
+import operator
+
 from django.db import models
 
 
@@ -22,8 +25,16 @@ class WebSiteManager(models.Manager):
     def get_by_natural_key(self, slug):
         return self.get(slug=slug)
 
+    def get_by_natural_keys(self, natural_keys):
+        return self.filter(slug__in=[slug for slug, in natural_keys])
+
 
 class PageManager(models.Manager):
 
     def get_by_natural_key(self, website_slug, slug):
         return self.get(website__slug=website_slug, slug=slug)
+
+    def get_by_natural_keys(self, natural_keys):
+        query = functools.reduce(operator.or_, [models.Q(website__slug=website_slug, slug=slug)
+                                                for website_slug, slug in natural_keys])
+        return self.filter(query).select_related('website')
@@ -78,6 +78,7 @@ class Page(models.Model):
 
     def natural_key(self):
         return self.website.natural_key() + (self.slug, )
+    natural_key.dependencies = ['app.website']
 
     def __str__(self):
         return "%s -- %s" % (str(self.website), self.slug)
@@ -23,7 +23,6 @@ from hashlib import sha1
 
 from deep_serializer import (BaseMetaWalkClass, WALKING_STOP,
                              ONLY_REFERENCE, WALKING_INTO_CLASS)
-from deep_serializer.exceptions import update_the_serializer
 
 
 class MyMetaWalkClass(BaseMetaWalkClass):
@@ -71,15 +70,9 @@ class WebSiteClone(MyMetaWalkClass):
         obj.initial_page = None
         return obj
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name in ('initial_page', 'websites_created_of'):
-            return WALKING_STOP
-        elif field_name in ('original_website', 'owners'):
-            return ONLY_REFERENCE
-        elif field_name == 'page':
-            return WALKING_INTO_CLASS
-        update_the_serializer(obj, field_name)
+    walking_rules = {('initial_page', 'websites_created_of'): WALKING_STOP,
+                     ('original_website', 'owners'): ONLY_REFERENCE,
+                     'page': WALKING_INTO_CLASS}
 
 
 class PageClone(MyMetaWalkClass):
@@ -93,21 +86,21 @@ class PageClone(MyMetaWalkClass):
         obj.created_from_id = obj.pk
         return obj
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name in ('pages_created_of', 'website', 'website_initial_page'):
-            return WALKING_STOP
-        elif field_name in ('created_from', 'last_editor'):
-            return ONLY_REFERENCE
-        update_the_serializer(obj, field_name)
+    walking_rules = {('pages_created_of', 'website', 'website_initial_page'): WALKING_STOP,
+                     ('created_from', 'last_editor'): ONLY_REFERENCE}
 
     @classmethod
-    def post_save(cls, initial_obj, obj, request=None):
-        super(PageClone, cls).post_save(initial_obj, obj, request=request)
-        initial_page = obj.created_from.website.initial_page
-        if initial_page and obj.slug == initial_page.slug:
-            obj.website.initial_page = obj
-            obj.website.save()
+    def post_save_batch(cls, initial_obj, objs, request=None):
+        super(PageClone, cls).post_save_batch(initial_obj, objs, request=request)
+        # The original pages (with their websites and initial pages) of all the pages in one query
+        created_from_ids = [obj.created_from_id for obj in objs]
+        pages_created_from = objs[0].__class__.objects.select_related(
+            'website__initial_page').in_bulk(created_from_ids)
+        for obj in objs:
+            initial_page = pages_created_from[obj.created_from_id].website.initial_page
+            if initial_page and obj.slug == initial_page.slug:
+                obj.website.initial_page = obj
+                obj.website.save()
 
 ## End example 1
 
@@ -121,15 +114,9 @@ def get_new_username(website_slug, username):
 
 class WebSiteOwnersClone(WebSiteClone):
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name in ('initial_page', 'websites_created_of'):
-            return WALKING_STOP
-        elif field_name == 'original_website':
-            return ONLY_REFERENCE
-        elif field_name in ('page', 'owners'):
-            return WALKING_INTO_CLASS
-        update_the_serializer(obj, field_name)
+    walking_rules = {('initial_page', 'websites_created_of'): WALKING_STOP,
+                     'original_website': ONLY_REFERENCE,
+                     ('page', 'owners'): WALKING_INTO_CLASS}
 
     @classmethod
     def post_save(cls, initial_obj, obj, request=None):
@@ -145,19 +132,15 @@ class WebSiteOwnersClone(WebSiteClone):
 
 class PageOwnersClone(PageClone):
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name in ('pages_created_of', 'website', 'website_initial_page'):
-            return WALKING_STOP
-        elif field_name == 'created_from':
-            return ONLY_REFERENCE
-        elif field_name == 'last_editor':
-            return WALKING_INTO_CLASS
-        update_the_serializer(obj, field_name)
+    walking_rules = {('pages_created_of', 'website', 'website_initial_page'): WALKING_STOP,
+                     'created_from': ONLY_REFERENCE,
+                     'last_editor': WALKING_INTO_CLASS}
 
 
 class UserClone(BaseMetaWalkClass):
 
+    static_walking = True
+
     @classmethod
     def pre_serialize(cls, initial_obj, obj, request, serialize_options=None):
         obj = super(UserClone, cls).pre_serialize(initial_obj, obj,
@@ -197,24 +180,14 @@ class UserClone(BaseMetaWalkClass):
 
 class WebSiteRestore(MyMetaWalkClass):
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name in ('websites_created_of', 'initial_page', 'original_website', 'owners'):
-            return ONLY_REFERENCE
-        elif field_name == 'page':
-            return WALKING_INTO_CLASS
-        update_the_serializer(obj, field_name)
+    walking_rules = {('websites_created_of', 'initial_page', 'original_website', 'owners'): ONLY_REFERENCE,
+                     'page': WALKING_INTO_CLASS}
 
 
 class PageRestore(MyMetaWalkClass):
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name == 'website_initial_page':
-            return WALKING_STOP
-        elif field_name in ('pages_created_of', 'created_from', 'website', 'last_editor'):
-            return ONLY_REFERENCE
-        update_the_serializer(obj, field_name)
+    walking_rules = {'website_initial_page': WALKING_STOP,
+                     ('pages_created_of', 'created_from', 'website', 'last_editor'): ONLY_REFERENCE}
 
 
 ## End example 3
@@ -233,24 +206,14 @@ class WebSiteRestoreNaturalKey(MyMetaWalkClass):
             obj.initial_page = None
         return obj
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name in ('websites_created_of', 'initial_page', 'original_website', 'owners', 'last_editor'):
-            return ONLY_REFERENCE
-        elif field_name == 'page':
-            return WALKING_INTO_CLASS
-        update_the_serializer(obj, field_name)
+    walking_rules = {('websites_created_of', 'initial_page', 'original_website', 'owners', 'last_editor'): ONLY_REFERENCE,
+                     'page': WALKING_INTO_CLASS}
 
 
 class PageRestoreNaturalKey(MyMetaWalkClass):
 
-    @classmethod
-    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
-        if field_name == 'website_initial_page':
-            return WALKING_STOP
-        elif field_name in ('pages_created_of', 'created_from', 'website', 'last_editor'):
-            return ONLY_REFERENCE
-        update_the_serializer(obj, field_name)
+    walking_rules = {'website_initial_page': WALKING_STOP,
+                     ('pages_created_of', 'created_from', 'website', 'last_editor'): ONLY_REFERENCE}
 
     @classmethod
     def post_save(cls, initial_obj, obj, request=None):
@@ -16,15 +16,76 @@
 
 import json
 import sys
+import threading
+import time
 
-from django.contrib.auth.models import User
+from xml.dom import minidom
+
+from django.utils.encoding import smart_bytes
+from django.utils.six import StringIO
+
+from django.contrib.auth.models import User, Group, Permission
 from django.conf import settings
-from django.test import TestCase
+from django.core import serializers
+from django.test import TestCase, TransactionTestCase
+from django.db import connection, connections
+from django.db.transaction import TransactionManagementError
+from django.db.models import get_model
 
+from deep_serializer import (serializer, serializer_many, deserializer, get_serializer, get_deserializer,
+                             compile_walk_plan, BaseMetaWalkClass, WALKING_STOP, ONLY_REFERENCE, WALKING_INTO_CLASS)
+from deep_serializer.asynchronous import aserializer
+from deep_serializer.dependencies import add_natural_keys, sort_by_dependencies
+from deep_serializer.exceptions import (DeepSerializerDoesNotExist, SerializationCancelled,
+                                        SerializationBudgetExceeded)
+from deep_serializer.parallel import serializer_parallel
 from deep_serializer.serializers.base import DeserializationError
+from deep_serializer.utils import get_max_query_params, get_model_relations, get_reference_key, IdentityMap
 
+from example.app import serializer as example_serializer
 from example.app.models import WebSite, Page
-from example.app.utils import clone_website, serialize_website, deserialize_website
+from example.app.serializer import WebSiteClone, WebSiteRestore, PageRestore
+from example.app.utils import (clone_website, serialize_website, deserialize_website,
+                               get_params_to_serialize_deserialize,
+                               walking_clone_classes, walking_restore_classes)
+
+try:
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = ProcessPoolExecutor = None
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    from django.test.utils import CaptureQueriesContext
+except ImportError:  # Django < 1.6
+
+    class CaptureQueriesContext(object):
+        """
+            Capture the queries executed by the connection (the debug cursor records them)
+        """
+
+        def __init__(self, connection):
+            self.connection = connection
+
+        @property
+        def captured_queries(self):
+            return self.connection.queries[self.initial_queries:self.final_queries]
+
+        def __enter__(self):
+            self.use_debug_cursor = self.connection.use_debug_cursor
+            self.connection.use_debug_cursor = True
+            self.initial_queries = len(self.connection.queries)
+            self.final_queries = None
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            self.connection.use_debug_cursor = self.use_debug_cursor
+            if exc_type is None:
+                self.final_queries = len(self.connection.queries)
 
 if sys.version_info[0] >= 2:
     string = str
@@ -32,17 +93,187 @@ else:
     string = basestring
 
 
+class WebSiteWalkPages(BaseMetaWalkClass):
+
+    @classmethod
+    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
+        if field_name == 'page':
+            return WALKING_INTO_CLASS
+        return ONLY_REFERENCE
+
+
+class CountWebSiteWalkPages(WebSiteWalkPages):
+
+    static_walking = True
+    num_calls = 0
+
+    @classmethod
+    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
+        CountWebSiteWalkPages.num_calls += 1
+        return super(CountWebSiteWalkPages, cls).walking_into_class(initial_obj, obj, field_name,
+                                                                    model, request=request)
+
+
+class WebSiteWithoutRules(BaseMetaWalkClass):
+
+    walking_rules = {('initial_page', 'websites_created_of', 'original_website', 'owners'): ONLY_REFERENCE}
+
+
+class OnlyReference(BaseMetaWalkClass):
+
+    @classmethod
+    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
+        return ONLY_REFERENCE
+
+
+class PageWalkCreatedFrom(BaseMetaWalkClass):
+
+    @classmethod
+    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
+        if field_name == 'created_from':
+            return WALKING_INTO_CLASS
+        return ONLY_REFERENCE
+
+
+class PageWalkLastEditor(BaseMetaWalkClass):
+
+    @classmethod
+    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
+        if field_name == 'last_editor':
+            return WALKING_INTO_CLASS
+        return ONLY_REFERENCE
+
+
+walking_pages_classes = {WebSite: WebSiteWalkPages,
+                         Page: OnlyReference,
+                         User: OnlyReference}
+
+walking_last_editor_classes = {WebSite: WebSiteWalkPages,
+                               Page: PageWalkLastEditor,
+                               User: OnlyReference,
+                               Group: OnlyReference,
+                               Permission: OnlyReference}
+
+class UserWalkGroups(BaseMetaWalkClass):
+
+    @classmethod
+    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
+        if field_name == 'groups':
+            return WALKING_INTO_CLASS
+        return ONLY_REFERENCE
+
+
+walking_groups_classes = {WebSite: WebSiteWalkPages,
+                          Page: PageWalkLastEditor,
+                          User: UserWalkGroups,
+                          Group: OnlyReference,
+                          Permission: OnlyReference}
+
+class PageWalkPagesCreatedOf(BaseMetaWalkClass):
+
+    @classmethod
+    def walking_into_class(cls, initial_obj, obj, field_name, model, request=None):
+        if field_name == 'pages_created_of':
+            return WALKING_INTO_CLASS
+        return ONLY_REFERENCE
+
+
+walking_pages_created_of_classes = {WebSite: WebSiteWalkPages,
+                                    Page: PageWalkPagesCreatedOf,
+                                    User: OnlyReference}
+
+walking_created_from_classes = {WebSite: OnlyReference,
+                                Page: PageWalkCreatedFrom,
+                                User: OnlyReference}
+
+
+class StreamPage(OnlyReference):
+
+    stream = None
+    stream_sizes = []
+
+    @classmethod
+    def pre_serialize(cls, initial_obj, obj, request=None, serialize_options=None):
+        cls.stream_sizes.append(len(cls.stream.getvalue()))
+        return obj
+
+
+class PageSerializeWebSite(OnlyReference):
+
+    @classmethod
+    def pre_serialize(cls, initial_obj, obj, request=None, serialize_options=None):
+        return obj.website
+
+
+class BatchPage(OnlyReference):
+
+    num_calls = 0
+
+    @classmethod
+    def pre_serialize_batch(cls, initial_obj, objs, request=None, serialize_options=None):
+        BatchPage.num_calls += 1
+        return objs
+
+
+class BatchPageSummary(OnlyReference):
+
+    @classmethod
+    def pre_serialize_batch(cls, initial_obj, objs, request=None, serialize_options=None):
+        # A new page instead of all the pages
+        summary = Page(title='Summary', slug='summary', website=initial_obj)
+        return [summary for obj in objs]
+
+
+class WebSiteWalkPagesOwners(BaseMetaWalkClass):
+
+    walking_rules = {('page', 'owners'): WALKING_INTO_CLASS,
+                     ('initial_page', 'websites_created_of', 'original_website'): ONLY_REFERENCE}
+
+
+class PageInitialObj(OnlyReference):
+
+    initial_objs = {}
+
+    @classmethod
+    def pre_serialize(cls, initial_obj, obj, request=None, serialize_options=None):
+        cls.initial_objs[obj.pk] = initial_obj.pk
+        return obj
+
+
+class PageStopWebSite(BaseMetaWalkClass):
+
+    walking_rules = {'website': WALKING_STOP,
+                     ('created_from', 'last_editor', 'pages_created_of', 'website_initial_page'): ONLY_REFERENCE}
+
+
+walking_stop_website_classes = {WebSite: OnlyReference,
+                                Page: PageStopWebSite,
+                                User: OnlyReference}
+
+# Like walking_restore_classes_natural, without hooks for the initial page
+walking_restore_two_phase_classes = {WebSite: WebSiteRestore,
+                                     Page: PageRestore,
+                                     User: BaseMetaWalkClass}
+
+
+class FixedTime(object):
+
+    @classmethod
+    def time(cls):
+        return 0
+
+
 class DeepSerializerTestCase(TestCase):
 
     fixtures = ['app_data.json']
 
     # Test type 1: Clone website
 
-    def test_clone(self, action='clone', format='json'):
+    def test_clone(self, action='clone', format='json', batched=False):
         websites = list(WebSite.objects.all())
         pages = list(Page.objects.all())
         website = WebSite.objects.get(pk=1)
-        objs = clone_website(website, action=action, format=format)
+        objs = clone_website(website, action=action, format=format, batched=batched)
         self.assertEqual(WebSite.objects.all().count(), len(websites) * 2)
         self.assertEqual(Page.objects.all().count(), len(pages) * 2)
         for new_obj in objs:
@@ -57,9 +288,24 @@ class DeepSerializerTestCase(TestCase):
                 raise AssertionError("The object is instance of an unknow class")
         return objs
 
+    def test_clone_initial_page(self):
+        website = WebSite.objects.get(pk=1)
+        initial_page_slug = website.initial_page.slug
+        objs = clone_website(website)
+        new_website = WebSite.objects.get(pk=[obj for obj in objs if isinstance(obj, WebSite)][0].pk)
+        self.assertNotEqual(new_website.pk, website.pk)
+        self.assertEqual(new_website.initial_page.website, new_website)
+        self.assertEqual(new_website.initial_page.slug, initial_page_slug)
+
     def test_clone_xml(self):
         self.test_clone(format='xml')
 
+    def test_clone_batched(self):
+        self.test_clone(batched=True)
+
+    def test_clone_batched_xml(self):
+        self.test_clone(format='xml', batched=True)
+
     def test_clone_python(self):
         self.test_clone(format='python')
 
@@ -68,9 +314,9 @@ class DeepSerializerTestCase(TestCase):
 
     # Test type 2: Clone website with owners
 
-    def test_clone_with_owners(self, format='json'):
+    def test_clone_with_owners(self, format='json', batched=False):
         users = list(User.objects.all())
-        new_objs = self.test_clone(action='clone-with-owners', format=format)
+        new_objs = self.test_clone(action='clone-with-owners', format=format, batched=batched)
         self.assertEqual(User.objects.all().count(), len(users) * 2)
         for new_obj in new_objs:
             if isinstance(new_obj, WebSite):
@@ -86,6 +332,9 @@ class DeepSerializerTestCase(TestCase):
             else:
                 raise AssertionError("The object is instance of an unknow class")
 
+    def test_clone_with_owners_batched(self):
+        self.test_clone_with_owners(batched=True)
+
     def test_clone_with_owners_xml(self):
         self.test_clone_with_owners(format='xml')
 
@@ -433,3 +682,864 @@ class DeepSerializerTestCase(TestCase):
 
     def test_clone_xml_filtering(self):
         self.test_clone_filtering(action='clone-filtering-objects', format='xml')
+
+
+class DeepSerializerPerformanceTestCase(TestCase):
+
+    fixtures = ['app_data.json']
+
+    def create_pages(self, website, num_pages):
+        Page.objects.bulk_create([Page(title='Page %s' % i,
+                                       slug='page-%s' % i,
+                                       website=website)
+                                  for i in range(num_pages)])
+
+    def serialize_fixed_clone(self, format='json', action='clone-with-owners', serialize=serializer, **kwargs):
+        """
+            Serialize a clone of the website with a fixed slug and title,
+            so the fixtures of several serializations can be compared
+        """
+        walking_classes, natural_keys = get_params_to_serialize_deserialize(action)
+        get_hash, clone_time = example_serializer.get_hash, example_serializer.time
+        example_serializer.get_hash = lambda: 'fixed-hash'
+        example_serializer.time = FixedTime
+        try:
+            return serialize(format, WebSite.objects.get(pk=1),
+                              walking_classes=walking_classes,
+                              natural_keys=natural_keys,
+                              can_get_objs_from_several_path=action == 'clone-with-owners',
+                              **kwargs)
+        finally:
+            example_serializer.get_hash, example_serializer.time = get_hash, clone_time
+
+    def test_walk_big_graph(self, num_pages=50000, time_budget=30):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        serializer = get_serializer('python')
+        object_list = []
+        start = time.time()
+        serializer.objects_to_serialize(website, website, object_list,
+                                        walking_classes=walking_pages_classes,
+                                        walking_always=False)
+        self.assertTrue(time.time() - start < time_budget)
+        self.assertEqual(len(object_list), Page.objects.filter(website=website).count() + 1)
+        self.assertEqual(object_list[0], website)
+
+    def test_walk_deep_graph(self):
+        website = WebSite.objects.get(pk=1)
+        first_pk = Page.objects.order_by('-pk')[0].pk + 1
+        num_pages = sys.getrecursionlimit() * 2
+        Page.objects.bulk_create([Page(pk=first_pk + i,
+                                       title='Page %s' % i,
+                                       slug='page-%s' % i,
+                                       website=website,
+                                       created_from_id=i and first_pk + i - 1 or None)
+                                  for i in range(num_pages)])
+        last_page = Page.objects.get(pk=first_pk + num_pages - 1)
+        object_list = []
+        get_serializer('python').objects_to_serialize(last_page, last_page, object_list,
+                                                      walking_classes=walking_created_from_classes,
+                                                      walking_always=False)
+        self.assertEqual([page.pk for page in object_list],
+                         list(range(first_pk + num_pages - 1, first_pk - 1, -1)))
+
+    def test_walk_batched_foreign_keys(self, num_pages=50):
+        website = WebSite.objects.get(pk=1)
+        users = list(User.objects.all())
+        Page.objects.bulk_create([Page(title='Page %s' % i,
+                                       slug='page-%s' % i,
+                                       website=website,
+                                       last_editor=users[i % len(users)])
+                                  for i in range(num_pages)])
+        website = WebSite.objects.get(pk=1)
+        object_list = []
+        # One query to the pages and one query to their last editors, and the
+        # prefetch of the m2m relations: website owners, user groups and user permissions
+        with self.assertNumQueries(5):
+            get_serializer('python').objects_to_serialize(website, website, object_list,
+                                                          walking_classes=walking_last_editor_classes,
+                                                          walking_always=False,
+                                                          batched=True)
+        self.assertEqual(len(object_list), Page.objects.filter(website=website).count() + len(users) + 1)
+
+    def test_walk_batched_many_to_many(self, num_pages=50):
+        website = WebSite.objects.get(pk=1)
+        users = list(User.objects.all())
+        groups = [Group.objects.create(name='Group %s' % i) for i in range(len(users))]
+        for user, group in zip(users, groups):
+            user.groups = groups
+        Page.objects.bulk_create([Page(title='Page %s' % i,
+                                       slug='page-%s' % i,
+                                       website=website,
+                                       last_editor=users[i % len(users)])
+                                  for i in range(num_pages)])
+        website = WebSite.objects.get(pk=1)
+        object_list = []
+        # One query to the pages, one query to the users and one query
+        # for every m2m relation of every model
+        with self.assertNumQueries(6):
+            get_serializer('python').objects_to_serialize(website, website, object_list,
+                                                          walking_classes=walking_groups_classes,
+                                                          walking_always=False,
+                                                          batched=True)
+        self.assertEqual(len(object_list), Page.objects.filter(website=website).count() + len(users) + len(groups) + 1)
+        # The serializers use the prefetched objects
+        with self.assertNumQueries(0):
+            fixtures = serializers.serialize('python', object_list)
+        for fixture in fixtures:
+            if fixture['model'] == 'auth.user':
+                self.assertEqual(sorted(fixture['fields']['groups']), sorted(group.pk for group in groups))
+
+    def test_walk_batched_reverse(self, num_pages=20, num_children=2):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        for page in Page.objects.filter(website=website, slug__startswith='page-'):
+            Page.objects.bulk_create([Page(title='Child %s' % i,
+                                           slug='%s-child-%s' % (page.slug, i),
+                                           website=website,
+                                           created_from=page)
+                                      for i in range(num_children)])
+        website = WebSite.objects.get(pk=1)
+        object_list = []
+        # The prefetch of the owners, the pages of the website and the children of all the pages
+        with self.assertNumQueries(3):
+            get_serializer('python').objects_to_serialize(website, website, object_list,
+                                                          walking_classes=walking_pages_created_of_classes,
+                                                          walking_always=False,
+                                                          batched=True)
+        self.assertEqual(len(object_list), Page.objects.filter(website=website).count() + 1)
+
+    def test_model_relations(self):
+        relations = get_model_relations(Page)
+        self.assertTrue(relations is get_model_relations(Page))
+        self.assertEqual([field.name for field in relations.fks],
+                         ['website', 'created_from', 'last_editor'])
+        self.assertEqual(sorted((relation.name, relation.accessor_name) for relation in relations.reverses),
+                         [('pages_created_of', 'pages_created_of'),
+                          ('website_initial_page', 'website_initial_page')])
+        self.assertEqual(sorted((relation.name, relation.accessor_name)
+                                for relation in get_model_relations(WebSite).reverses),
+                         [('page', 'page_set'), ('websites_created_of', 'websites_created_of')])
+        self.assertTrue(relations.has_natural_key)
+        self.assertEqual(relations.natural_key_fields, ('website', ))
+        self.assertEqual(get_model_relations(WebSite).natural_key_fields, ())
+
+    def test_walk_plan(self):
+        walk_plan = compile_walk_plan({WebSite: CountWebSiteWalkPages,
+                                       Page: OnlyReference,
+                                       User: OnlyReference})
+        CountWebSiteWalkPages.num_calls = 0
+        for i in range(2):
+            fixtures = serializer('json', WebSite.objects.get(pk=1),
+                                  walking_classes=walk_plan,
+                                  natural_keys=False)
+        # Once per relation of the website (to a model of the plan), not once per serialization
+        self.assertEqual(CountWebSiteWalkPages.num_calls, 5)
+        self.assertEqual(fixtures, serializer('json', WebSite.objects.get(pk=1),
+                                              walking_classes=dict(walk_plan),
+                                              natural_keys=False))
+        self.assertEqual(CountWebSiteWalkPages.num_calls, 10)
+        self.assertRaises(TypeError, walk_plan.update, {WebSite: BaseMetaWalkClass})
+
+    def test_walking_rules(self):
+        self.assertEqual(WebSiteClone.get_walking_rules(),
+                         {'initial_page': WALKING_STOP,
+                          'websites_created_of': WALKING_STOP,
+                          'original_website': ONLY_REFERENCE,
+                          'owners': ONLY_REFERENCE,
+                          'page': WALKING_INTO_CLASS})
+        # The relation "page" has not a rule
+        walking_classes = {WebSite: WebSiteWithoutRules, Page: OnlyReference, User: OnlyReference}
+        for walking_classes in (walking_classes, compile_walk_plan(walking_classes)):
+            self.assertRaises(DeepSerializerDoesNotExist, serializer, 'json',
+                              WebSite.objects.get(pk=1), walking_classes=walking_classes)
+
+    def test_walk_plan_restore(self):
+        website = WebSite.objects.get(pk=1)
+        self.assertEqual(serializer('json', website,
+                                    walking_classes=walking_restore_classes,
+                                    natural_keys=False),
+                         serializer('json', website,
+                                    walking_classes=dict(walking_restore_classes),
+                                    natural_keys=False))
+
+    def test_serialize_read_only(self):
+        website = WebSite.objects.get(pk=1)
+        num_owners = website.owners.count()
+        self.assertTrue(num_owners > 0)
+        # The users are not in the walking classes, so the owners are stopped
+        walking_classes = {WebSite: WebSiteWalkPages, Page: OnlyReference}
+        with CaptureQueriesContext(connection) as context:
+            fixtures = serializer('python', website,
+                                  walking_classes=walking_classes,
+                                  natural_keys=False,
+                                  read_only=True)
+        for query in context.captured_queries:
+            for statement in ('INSERT', 'UPDATE', 'DELETE'):
+                self.assertFalse(statement in query['sql'], query['sql'])
+        self.assertEqual(fixtures[0]['fields']['owners'], [])
+        self.assertEqual(WebSite.objects.get(pk=1).owners.count(), num_owners)
+        self.assertEqual(fixtures, serializer('python', WebSite.objects.get(pk=1),
+                                              walking_classes=walking_classes,
+                                              natural_keys=False))
+
+    def test_serialize_threads(self, num_pages=20, num_serializations=100, num_threads=8):
+        if ThreadPoolExecutor is None:
+            return
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        pages_pk = list(Page.objects.values_list('pk', flat=True))
+        # The threads use the connection of the test, the test database is in memory
+        shared_connection = connections['default']
+        shared_connection.allow_thread_sharing = True
+
+        def serialize_page(pk):
+            connections['default'] = shared_connection
+            return serializer('python', Page.objects.get(pk=pk),
+                              walking_classes=walking_stop_website_classes,
+                              natural_keys=False,
+                              read_only=True)
+        pks = [pages_pk[i % len(pages_pk)] for i in range(num_serializations)]
+        try:
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                results = list(executor.map(serialize_page, pks))
+        finally:
+            shared_connection.allow_thread_sharing = False
+        website_field = Page._meta.get_field('website')
+        self.assertFalse(website_field.null)
+        self.assertFalse(website_field.blank)
+        for pk, fixtures in zip(pks, results):
+            self.assertEqual(fixtures, serialize_page(pk))
+            self.assertEqual(fixtures[0]['pk'], pk)
+            self.assertEqual(fixtures[0]['fields']['website'], None)
+
+    def test_serialize_stream(self, num_pages=20):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        for format in ('json', 'xml'):
+            for batched in (False, True):
+                website = WebSite.objects.get(pk=1)
+                stream = StringIO()
+                self.assertEqual(serializer(format, website,
+                                            walking_classes=walking_restore_classes,
+                                            natural_keys=False,
+                                            batched=batched,
+                                            stream=stream), stream.getvalue())
+                self.assertEqual(stream.getvalue(), serializer(format, WebSite.objects.get(pk=1),
+                                                               walking_classes=walking_restore_classes,
+                                                               natural_keys=False,
+                                                               batched=batched))
+        # The objects are written while the pages are walked
+        StreamPage.stream = StringIO()
+        StreamPage.stream_sizes = []
+        serializer('json', WebSite.objects.get(pk=1),
+                   walking_classes={WebSite: WebSiteWalkPages, Page: StreamPage, User: OnlyReference},
+                   natural_keys=False,
+                   stream=StreamPage.stream)
+        self.assertEqual(len(StreamPage.stream_sizes), Page.objects.filter(website=website).count())
+        self.assertTrue(StreamPage.stream_sizes[-1] > StreamPage.stream_sizes[0] > 0)
+
+    def test_serialize_stream_clone_with_owners(self, num_pages=5):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        website.page_set.update(last_editor=User.objects.get(username='admin'))
+        for format in ('json', 'xml'):
+            for batched in (False, True):
+                fixtures = self.serialize_fixed_clone(format, batched=batched)
+                # The pages reference the cloned users, the hooks of the users run before writing the pages
+                self.assertEqual(self.serialize_fixed_clone(format, batched=batched, stream=StringIO()), fixtures)
+
+    def test_clone_batched_stream(self, num_pages=5):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        pages = list(website.page_set.all())
+        for format in ('json', 'xml'):
+            # The natural keys of the pages are cached before the hooks of the website change it
+            fixtures = serializer(format, WebSite.objects.get(pk=1),
+                                  walking_classes=walking_clone_classes,
+                                  natural_keys=True,
+                                  batched=True,
+                                  stream=StringIO())
+            objs = deserialize_website(website, fixtures, action='clone', format=format)
+            new_pages = [obj for obj in objs if isinstance(obj, Page)]
+            self.assertEqual(len(new_pages), len(pages))
+            self.assertEqual(set(new_page.created_from for new_page in new_pages), set(pages))
+
+    def test_pre_serialize_repeated_objects(self, num_pages=20):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        walking_classes = {WebSite: WebSiteWalkPages, Page: PageSerializeWebSite, User: OnlyReference}
+        for stream in (None, StringIO()):
+            fixtures = serializer('json', WebSite.objects.get(pk=1),
+                                  walking_classes=walking_classes,
+                                  natural_keys=False,
+                                  stream=stream)
+            fixtures = json.loads(fixtures)
+            self.assertEqual([(fixture['model'], fixture['pk']) for fixture in fixtures],
+                             [('app.website', 1)])
+
+    def test_pre_serialize_batch(self, num_pages=20):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        BatchPage.num_calls = 0
+        fixtures = serializer('json', WebSite.objects.get(pk=1),
+                              walking_classes={WebSite: WebSiteWalkPages, Page: BatchPage, User: OnlyReference},
+                              natural_keys=False)
+        # Once for all the pages of the website
+        self.assertEqual(BatchPage.num_calls, 1)
+        self.assertEqual(fixtures, serializer('json', WebSite.objects.get(pk=1),
+                                              walking_classes=walking_pages_classes,
+                                              natural_keys=False))
+
+    def test_pre_serialize_batch_new_objects(self, num_pages=5):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        fixtures = serializer('python', WebSite.objects.get(pk=1),
+                              walking_classes={WebSite: WebSiteWalkPages, Page: BatchPageSummary,
+                                               User: OnlyReference},
+                              natural_keys=False)
+        # The new object is serialized once
+        self.assertEqual([fixture['fields']['slug'] for fixture in fixtures if fixture['model'] == 'app.page'],
+                         ['summary'])
+
+    def test_natural_keys_cache(self):
+        website = WebSite.objects.get(pk=1)
+        num_queries = []
+        for num_pages in (10, 40):
+            Page.objects.filter(slug__startswith='page-').delete()
+            first_pk = Page.objects.order_by('-pk')[0].pk + 1
+            # Every page is created from the previous page
+            Page.objects.bulk_create([Page(pk=first_pk + i,
+                                           title='Page %s' % i,
+                                           slug='page-%s' % i,
+                                           website=website,
+                                           created_from_id=i and first_pk + i - 1 or None)
+                                      for i in range(num_pages)])
+            for batched in (False, True):
+                with CaptureQueriesContext(connection) as context:
+                    fixtures = serializer('python', WebSite.objects.get(pk=1),
+                                          walking_classes=walking_pages_classes,
+                                          batched=batched)
+                num_queries.append(len(context.captured_queries))
+                for fixture in fixtures:
+                    if fixture['fields']['slug'] == 'page-1':
+                        self.assertEqual(fixture['fields']['created_from'], ('my-website', 'page-0'))
+        # The natural keys of the references to walked objects do not query
+        self.assertEqual(num_queries[:2], num_queries[2:])
+
+    def test_identity_map(self):
+        website = WebSite.objects.get(pk=1)
+        num_queries = []
+        for num_users in (2, 6):
+            Page.objects.filter(slug__startswith='page-').delete()
+            users = [User.objects.create(username='user-%s-%s' % (num_users, i)) for i in range(num_users)]
+            website.owners = users
+            # The last editors are owners of the website too
+            Page.objects.bulk_create([Page(title='Page %s' % i,
+                                           slug='page-%s' % i,
+                                           website=website,
+                                           last_editor=user)
+                                      for i, user in enumerate(users)])
+            with CaptureQueriesContext(connection) as context:
+                fixtures = serializer('python', WebSite.objects.get(pk=1),
+                                      walking_classes=walking_pages_classes)
+            num_queries.append(len(context.captured_queries))
+            for fixture in fixtures:
+                if fixture['fields']['slug'].startswith('page-'):
+                    self.assertTrue(fixture['fields']['last_editor'][0].startswith('user-%s-' % num_users))
+        # The last editors are not loaded again
+        self.assertEqual(num_queries[0], num_queries[1])
+        # Only the natural keys are kept, not the objects
+        identity_map = IdentityMap()
+        identity_map.add_natural_key(website)
+        self.assertEqual(identity_map.natural_keys, {(WebSite, website.pk): website.natural_key()})
+        self.assertEqual(list(vars(identity_map)), ['natural_keys'])
+
+    def test_walk_many_to_many(self, num_pages=10):
+        website = WebSite.objects.get(pk=1)
+        users = list(User.objects.all())
+        groups = [Group.objects.create(name='Group %s' % i) for i in range(3)]
+        for user in users:
+            user.groups = groups
+        Page.objects.bulk_create([Page(title='Page %s' % i,
+                                       slug='page-%s' % i,
+                                       website=website,
+                                       last_editor=users[i % len(users)])
+                                  for i in range(num_pages)])
+        object_list = []
+        get_serializer('python').objects_to_serialize(website, website, object_list,
+                                                      walking_classes=walking_groups_classes,
+                                                      walking_always=False)
+        # The walked many to many relations (the groups of the users) are not queried again:
+        # the owners of the website, the permissions of every user and every group
+        with self.assertNumQueries(1 + len(users) + len(groups)):
+            serializers.serialize('python', object_list)
+
+    def test_serialize_many(self, num_pages=5):
+        websites = [WebSite.objects.get(pk=1), WebSite.objects.create(title='Other website', slug='other-website')]
+        users = list(User.objects.all())
+        for website in websites:
+            website.owners = users
+            Page.objects.bulk_create([Page(title='Page %s' % i,
+                                           slug='page-%s' % i,
+                                           website=website)
+                                      for i in range(num_pages)])
+        walking_classes = {WebSite: WebSiteWalkPagesOwners, Page: PageInitialObj, User: OnlyReference}
+        for stream in (None, StringIO()):
+            for batched in (False, True):
+                PageInitialObj.initial_objs = {}
+                fixtures = serializer_many('json', websites + [websites[0]],
+                                           walking_classes=walking_classes,
+                                           natural_keys=False,
+                                           batched=batched,
+                                           stream=stream)
+                if stream is not None:
+                    fixtures = stream.getvalue()
+                    stream.truncate(0)
+                    stream.seek(0)
+                fixtures = json.loads(fixtures)
+                fixtures_keys = [(fixture['model'], fixture['pk']) for fixture in fixtures]
+                # The owners are serialized once
+                self.assertEqual(len(fixtures_keys), len(set(fixtures_keys)))
+                self.assertEqual(len([key for key in fixtures_keys if key[0] == 'auth.user']), len(users))
+                self.assertEqual(len([key for key in fixtures_keys if key[0] == 'app.website']), len(websites))
+                self.assertEqual(len([key for key in fixtures_keys if key[0] == 'app.page']), Page.objects.count())
+                for page in Page.objects.all():
+                    self.assertEqual(PageInitialObj.initial_objs[page.pk], page.website_id)
+
+    def test_serialize_parallel_transaction(self):
+        if ProcessPoolExecutor is None:
+            return
+        # The test is inside a transaction, the connections can not be closed
+        self.assertRaises(TransactionManagementError, serializer_parallel, 'json', WebSite.objects.all(),
+                          walking_classes={WebSite: WebSiteWalkPagesOwners},
+                          natural_keys=False)
+
+    def test_serialize_cancelled(self):
+        website = WebSite.objects.get(pk=1)
+        cancelled = threading.Event()
+        fixtures = serializer('json', website,
+                              walking_classes=walking_clone_classes,
+                              cancelled=cancelled)
+        cancelled.set()
+        for stream in (None, StringIO()):
+            self.assertRaises(SerializationCancelled, serializer, 'json', website,
+                              walking_classes=walking_clone_classes,
+                              stream=stream,
+                              cancelled=cancelled)
+        num_pages = Page.objects.count()
+        self.assertRaises(SerializationCancelled, deserializer, 'json', fixtures,
+                          initial_obj=website,
+                          walking_classes=walking_clone_classes,
+                          cancelled=cancelled)
+        self.assertEqual(Page.objects.count(), num_pages)
+
+    def test_serialize_budget(self, num_pages=10):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        walking_classes = {WebSite: WebSiteWalkPagesOwners, Page: OnlyReference, User: OnlyReference}
+        for batched in (False, True):
+            fixtures = serializer('json', website,
+                                  walking_classes=walking_classes,
+                                  natural_keys=False,
+                                  batched=batched)
+            num_objects = len(json.loads(fixtures))
+            self.assertEqual(serializer('json', website,
+                                        walking_classes=walking_classes,
+                                        natural_keys=False,
+                                        batched=batched,
+                                        max_objects=num_objects,
+                                        max_depth=1,
+                                        max_bytes=len(fixtures)), fixtures)
+            for budget in ({'max_objects': num_objects - 1},
+                           {'max_depth': 0},
+                           {'max_bytes': len(fixtures) - 1},
+                           {'max_bytes': len(fixtures) - 1, 'stream': StringIO()}):
+                self.assertRaises(SerializationBudgetExceeded, serializer, 'json', website,
+                                  walking_classes=walking_classes,
+                                  natural_keys=False,
+                                  batched=batched,
+                                  **budget)
+        # max_bytes does not change the serialization to the stream mode
+        fixtures = self.serialize_fixed_clone()
+        self.assertEqual(self.serialize_fixed_clone(max_bytes=len(fixtures)), fixtures)
+        # The walk stops when it finds too many objects, before pre_serialize and the serialization
+        PageInitialObj.initial_objs = {}
+        self.assertRaises(SerializationBudgetExceeded, serializer, 'python', website,
+                          walking_classes={WebSite: WebSiteWalkPagesOwners, Page: PageInitialObj, User: OnlyReference},
+                          natural_keys=False,
+                          max_objects=num_pages)
+        self.assertEqual(PageInitialObj.initial_objs, {})
+
+    def test_explain(self, num_pages=10):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        walking_classes = {WebSite: WebSiteWalkPagesOwners, Page: OnlyReference, User: OnlyReference}
+        serializer = get_serializer('python')
+        with CaptureQueriesContext(connection) as captured_queries:
+            plan = serializer.explain(website, walking_classes=walking_classes, batched=True)
+        # Only counts and the primary key of the first object of every model, the objects are not loaded
+        for query in captured_queries.captured_queries:
+            self.assertTrue('COUNT(' in query['sql'] or 'LIMIT 1' in query['sql'], query['sql'])
+            if not 'COUNT(' in query['sql']:
+                self.assertFalse(',' in query['sql'].split(' FROM ')[0], query['sql'])
+        fixtures = serializer.serialize(website,
+                                        walking_classes=walking_classes,
+                                        natural_keys=False)
+        self.assertEqual(plan['num_objects'], len(fixtures))
+        self.assertEqual(plan['num_queries'], 2)
+        self.assertEqual(sorted(plan['models'].keys()), ['app.page', 'app.website', 'auth.user'])
+        self.assertEqual(plan['models']['app.website']['count'], 1)
+        self.assertEqual(plan['models']['app.page']['count'], website.page_set.count())
+        self.assertEqual(plan['models']['auth.user']['count'], website.owners.count())
+        website_relations = plan['models']['app.website']['relations']
+        self.assertEqual(website_relations['page'], {'model': 'app.page',
+                                                     'walking_status': WALKING_INTO_CLASS,
+                                                     'count': website.page_set.count()})
+        self.assertEqual(website_relations['initial_page'], {'model': 'app.page',
+                                                             'walking_status': ONLY_REFERENCE,
+                                                             'count': None})
+        self.assertEqual(plan['models']['app.page']['relations']['website']['walking_status'], ONLY_REFERENCE)
+        plan = serializer.explain(website, walking_classes=walking_classes)
+        self.assertEqual(plan['num_queries'], 2)
+
+    def test_explain_several_relations(self, num_pages=5):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        website.owners = User.objects.filter(username='admin')
+        last_editor = User.objects.create(username='editor')
+        website.page_set.update(last_editor=last_editor)
+        walking_classes, natural_keys = get_params_to_serialize_deserialize('clone-with-owners')
+        # The users are reached by a many to many relation (owners) and by a foreign key (last_editor)
+        plan = get_serializer('json').explain(website, walking_classes=walking_classes)
+        self.assertEqual(plan['models']['auth.user']['count'], 2)
+        self.assertEqual(plan['models']['app.website']['relations']['owners']['count'], 1)
+        self.assertEqual(plan['models']['app.page']['relations']['last_editor']['count'], 1)
+
+    def test_deserialize_sorted(self):
+        website = WebSite.objects.get(pk=1)
+        for format in ('python', 'json', 'xml', 'yaml'):
+            num_pages = Page.objects.count()
+            fixtures = serialize_website(website, format=format)
+            deserializer_class = get_deserializer(format)
+
+            class CountDeserializer(deserializer_class):
+                num_reorders = 0
+
+                @classmethod
+                def deserialize_reorder(cls, fixtures, num_item, num_reorder):
+                    CountDeserializer.num_reorders += 1
+                    return super(CountDeserializer, cls).deserialize_reorder(fixtures, num_item, num_reorder)
+            # Every object before the objects that it references
+            items = deserializer_class.get_fixtures_items(fixtures)
+            items.reverse()
+            fixtures = deserializer_class.set_fixtures_items(fixtures, items)
+            CountDeserializer.deserialize(fixtures,
+                                          initial_obj=website,
+                                          walking_classes=walking_clone_classes,
+                                          natural_keys=True)
+            self.assertEqual(CountDeserializer.num_reorders, 0)
+            self.assertEqual(Page.objects.count(), num_pages + website.page_set.count())
+        # Only the natural keys with objects out of the fixtures are ignored, not the errors
+        deserializer_class = get_deserializer('json')
+        fixtures = serialize_website(website, format='json')
+        items_data = [deserializer_class.get_fixtures_item_data(item)
+                      for item in deserializer_class.get_fixtures_items(fixtures)]
+        page_natural_key = Page.natural_key
+
+        def natural_key(page):
+            raise ValueError(page.slug)
+        Page.natural_key = natural_key
+        try:
+            self.assertRaises(ValueError, sort_by_dependencies, items_data)
+        finally:
+            Page.natural_key = page_natural_key
+
+    def test_sort_fixtures_queries(self, num_pages=10):
+        website = WebSite.objects.get(slug='my-website')
+        self.create_pages(website, num_pages)
+        for format in ('python', 'json', 'xml'):
+            deserializer_class = get_deserializer(format)
+            for natural_keys in (False, True):
+                fixtures = serializer(format, website,
+                                      walking_classes=walking_restore_two_phase_classes,
+                                      natural_keys=natural_keys)
+                # The natural keys of the fixtures are calculated with the objects of the fixtures
+                with CaptureQueriesContext(connection) as captured_queries:
+                    deserializer_class.sort_fixtures(fixtures, two_phase=True, bulk=True)
+                self.assertEqual(len(captured_queries.captured_queries), 0)
+            # The pages reference their website by primary key
+            fixtures = serializer(format, website,
+                                  walking_classes=walking_restore_two_phase_classes,
+                                  natural_keys=False)
+            items_data = [deserializer_class.get_fixtures_item_data(item)
+                          for item in deserializer_class.get_fixtures_items(fixtures)]
+            items_models = [get_model(*model_label.split('.')) for model_label, pk, fields in items_data]
+            keys = {}
+            with CaptureQueriesContext(connection) as captured_queries:
+                add_natural_keys(items_data, items_models, keys)
+            self.assertEqual(len(captured_queries.captured_queries), 0)
+            for page in website.page_set.all():
+                self.assertTrue(('app.page', get_reference_key(page.natural_key())) in keys)
+
+    def test_deserialize_two_phase(self):
+        for format in ('python', 'json', 'xml'):
+            website = WebSite.objects.get(slug='my-website')
+            initial_page_slug = website.initial_page.slug
+            pages_slug = sorted(website.page_set.values_list('slug', flat=True))
+            fixtures = serializer(format, website,
+                                  walking_classes=walking_restore_two_phase_classes,
+                                  natural_keys=True)
+            website.delete()
+            # The website references its initial page, and the page references its website
+            self.assertRaises(DeserializationError, deserializer, format, fixtures,
+                              walking_classes=walking_restore_two_phase_classes,
+                              natural_keys=True)
+            deserializer(format, fixtures,
+                         walking_classes=walking_restore_two_phase_classes,
+                         natural_keys=True,
+                         two_phase=True)
+            website = WebSite.objects.get(slug='my-website')
+            self.assertEqual(website.initial_page.slug, initial_page_slug)
+            self.assertEqual(website.initial_page.website, website)
+            self.assertEqual(sorted(website.page_set.values_list('slug', flat=True)), pages_slug)
+
+    def test_update_deferred_fks(self, num_pages=400):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        admin = User.objects.get(username='admin')
+        pages = list(website.page_set.all())
+        deferred = [(page, 'last_editor', admin.pk) for page in pages]
+        with CaptureQueriesContext(connection) as captured_queries:
+            get_deserializer('json').update_deferred_fks(deferred)
+        updates = [query['sql'] for query in captured_queries.captured_queries if 'UPDATE' in query['sql']]
+        max_query_params = get_max_query_params(connection)
+        if max_query_params is not None:
+            # Three parameters per page
+            self.assertEqual(len(updates), -(-len(pages) // (max_query_params // 3)))
+        self.assertEqual(website.page_set.filter(last_editor=admin).count(), len(pages))
+
+    def test_deserialize_bulk(self, num_pages=50):
+        website = WebSite.objects.get(slug='my-website')
+        website.owners = User.objects.all()
+        self.create_pages(website, num_pages)
+        for natural_keys in (False, True):
+            website = WebSite.objects.get(slug='my-website')
+            pages_slug = sorted(website.page_set.values_list('slug', flat=True))
+            owners = sorted(website.owners.values_list('pk', flat=True))
+            fixtures = serializer('json', website,
+                                  walking_classes=walking_restore_two_phase_classes,
+                                  natural_keys=natural_keys)
+            website.delete()
+            with CaptureQueriesContext(connection) as captured_queries:
+                deserializer('json', fixtures,
+                             walking_classes=walking_restore_two_phase_classes,
+                             natural_keys=natural_keys,
+                             two_phase=True,
+                             bulk=True,
+                             bulk_size=20)
+            inserts = [query['sql'] for query in captured_queries.captured_queries if 'INSERT' in query['sql']]
+            # The website, the pages in chunks of 20 pages and the owners
+            self.assertEqual(len(inserts), 1 + 3 + 1)
+            if natural_keys:
+                # The website and the pages are prefetched, the owners are queried once, and the
+                # primary keys of the website and of every chunk of pages are loaded after the insert
+                num_selects = 1 + 1 + User.objects.count() + 1 + 3
+            else:
+                num_selects = 0
+            # And the deferred initial page
+            self.assertEqual(len(captured_queries.captured_queries), len(inserts) + num_selects + 1)
+            website = WebSite.objects.get(slug='my-website')
+            self.assertEqual(sorted(website.page_set.values_list('slug', flat=True)), pages_slug)
+            self.assertEqual(sorted(website.owners.values_list('pk', flat=True)), owners)
+            self.assertTrue(website.initial_page.slug in pages_slug)
+
+    def test_deserialize_bulk_queries(self):
+        website = WebSite.objects.get(slug='my-website')
+        website.owners = User.objects.all()
+        for format in ('json', 'xml'):
+            for natural_keys in (False, True):
+                num_queries = []
+                for num_pages in (10, 50):
+                    website = WebSite.objects.get(slug='my-website')
+                    website.page_set.filter(slug__startswith='page-').delete()
+                    self.create_pages(website, num_pages)
+                    fixtures = serializer(format, website,
+                                          walking_classes=walking_restore_two_phase_classes,
+                                          natural_keys=natural_keys)
+                    website.delete()
+                    with CaptureQueriesContext(connection) as captured_queries:
+                        deserializer(format, fixtures,
+                                     walking_classes=walking_restore_two_phase_classes,
+                                     natural_keys=natural_keys,
+                                     two_phase=True,
+                                     bulk=True,
+                                     bulk_size=100)
+                    num_queries.append(len(captured_queries.captured_queries))
+                # The objects are not queried (nor saved) one by one
+                self.assertEqual(num_queries[0], num_queries[1])
+
+    def test_deserialize_saved_objects(self, num_pages=10):
+        website = WebSite.objects.get(slug='my-website')
+        website.owners = User.objects.all()
+        self.create_pages(website, num_pages)
+        for format in ('json', 'xml'):
+            website = WebSite.objects.get(slug='my-website')
+            pages_slug = sorted(website.page_set.values_list('slug', flat=True))
+            fixtures = serializer(format, website,
+                                  walking_classes=walking_restore_two_phase_classes,
+                                  natural_keys=True)
+            website.delete()
+            with CaptureQueriesContext(connection) as captured_queries:
+                deserializer(format, fixtures,
+                             walking_classes=walking_restore_two_phase_classes,
+                             natural_keys=True,
+                             two_phase=True)
+            website_queries = [query['sql'] for query in captured_queries.captured_queries
+                               if 'FROM "app_website" WHERE "app_website"."slug"' in query['sql']]
+            user_queries = [query['sql'] for query in captured_queries.captured_queries
+                            if 'FROM "auth_user" WHERE "auth_user"."username" =' in query['sql']]
+            # The website is searched before saving it (prefetched), the pages reference the saved website
+            self.assertEqual(len(website_queries), 1)
+            # Every user is searched once, the first time it is referenced
+            self.assertEqual(len(user_queries), User.objects.count())
+            website = WebSite.objects.get(slug='my-website')
+            self.assertEqual(sorted(website.page_set.values_list('slug', flat=True)), pages_slug)
+            self.assertTrue(website.initial_page.slug in pages_slug)
+
+    def test_deserialize_prefetch_natural_keys(self, num_pages=10):
+        website = WebSite.objects.get(slug='my-website')
+        self.create_pages(website, num_pages)
+        num_pages = website.page_set.count()
+        for format in ('json', 'xml'):
+            website = WebSite.objects.get(slug='my-website')
+            fixtures = serialize_website(website, action='clone', format=format)
+            with CaptureQueriesContext(connection) as captured_queries:
+                objs = deserialize_website(website, fixtures, action='clone', format=format)
+            page_queries = [query['sql'] for query in captured_queries.captured_queries
+                            if 'FROM "app_page" INNER JOIN "app_website"' in query['sql']]
+            # The new pages (by their natural key) and the original pages (created_from) are
+            # searched before saving them with one query, and one query of PageClone.post_save_batch
+            self.assertEqual(len(page_queries), 1 + 1)
+            pages = set(website.page_set.all())
+            self.assertEqual(set(obj.created_from for obj in objs if isinstance(obj, Page)), pages)
+
+    def test_deserialize_bulk_natural_keys(self, num_pages=5):
+        website = WebSite.objects.get(pk=1)
+        self.create_pages(website, num_pages)
+        pages = set(website.page_set.all())
+        for format in ('json', 'xml'):
+            fixtures = serialize_website(WebSite.objects.get(pk=1), action='clone', format=format)
+            # The pages do not have primary key in the fixtures, they get it after the insert
+            objs = deserializer(format, fixtures,
+                                initial_obj=WebSite.objects.get(pk=1),
+                                walking_classes=walking_clone_classes,
+                                natural_keys=True,
+                                bulk=True)
+            new_website = WebSite.objects.get(pk=[obj for obj in objs if isinstance(obj, WebSite)][0].pk)
+            new_pages = [obj for obj in objs if isinstance(obj, Page)]
+            self.assertEqual(set(new_website.page_set.all()), set(new_pages))
+            self.assertEqual(set(new_page.created_from for new_page in new_pages), pages)
+            # post_save_batch of the pages uses their primary keys
+            self.assertTrue(new_website.initial_page in new_pages)
+            self.assertEqual(new_website.initial_page.slug, website.initial_page.slug)
+
+    def test_serialize_async(self):
+        if asyncio is None or ThreadPoolExecutor is None:
+            return
+        website = WebSite.objects.get(pk=1)
+        fixtures = serializer('json', website,
+                              walking_classes=walking_restore_classes,
+                              natural_keys=False)
+        # The thread of the executor uses the connection of the test, the test database is in memory
+        shared_connection = connections['default']
+        shared_connection.allow_thread_sharing = True
+
+        def share_connection():
+            connections['default'] = shared_connection
+        executor = ThreadPoolExecutor(max_workers=1)
+        executor.submit(share_connection).result()
+        loop = asyncio.new_event_loop()
+        try:
+            self.assertEqual(loop.run_until_complete(aserializer('json', website,
+                                                                 walking_classes=walking_restore_classes,
+                                                                 natural_keys=False,
+                                                                 executor=executor,
+                                                                 loop=loop)), fixtures)
+
+            def aserialize(format, *args, **kwargs):
+                return loop.run_until_complete(aserializer(format, *args, executor=executor, loop=loop, **kwargs))
+            # The same fixtures as serializer, the hooks of clone-with-owners change the referenced users
+            self.assertEqual(self.serialize_fixed_clone(serialize=aserialize), self.serialize_fixed_clone())
+            # An asyncio future, the event of the caller is used
+            cancelled = threading.Event()
+            cancelled.set()
+            future = aserializer('json', website,
+                                 walking_classes=walking_restore_classes,
+                                 executor=executor,
+                                 loop=loop,
+                                 cancelled=cancelled)
+            self.assertTrue(isinstance(future, asyncio.Future))
+            self.assertRaises(SerializationCancelled, loop.run_until_complete, future)
+        finally:
+            loop.close()
+            executor.shutdown()
+            shared_connection.allow_thread_sharing = False
+
+
+class DeepSerializerParallelTestCase(TransactionTestCase):
+
+    fixtures = ['app_data.json']
+
+    def test_serialize_parallel(self, num_websites=4, num_pages=3):
+        if ProcessPoolExecutor is None:
+            return
+        users = list(User.objects.all())
+        for i in range(num_websites):
+            website = WebSite.objects.create(title=u'Website \xf1 %s' % i, slug='website-%s' % i)
+            website.owners = users
+            Page.objects.bulk_create([Page(title=u'Page \xf1 %s' % j,
+                                           slug='page-%s' % j,
+                                           website=website)
+                                      for j in range(num_pages)])
+        websites = WebSite.objects.order_by('pk')
+        walking_classes = {WebSite: WebSiteWalkPagesOwners, Page: BaseMetaWalkClass, User: OnlyReference}
+        fixtures = serializer_many('python', websites,
+                                   walking_classes=walking_classes,
+                                   natural_keys=False,
+                                   read_only=True)
+        fixtures_keys = sorted((fixture['model'], fixture['pk']) for fixture in fixtures)
+        # The workers are forked: the test database is in memory, so they use the connection of
+        # this process (it is not closed), this does not check that they open their own connections
+        for format in ('python', 'json', 'xml'):
+            # Every shard serializes the owners, the merged fixtures have them once
+            parallel_fixtures = serializer_parallel(format, websites,
+                                                    max_workers=2,
+                                                    num_shards=3,
+                                                    walking_classes=walking_classes,
+                                                    natural_keys=False,
+                                                    read_only=True)
+            if format == 'json':
+                parallel_fixtures = json.loads(parallel_fixtures)
+            elif format == 'xml':
+                root = minidom.parseString(smart_bytes(parallel_fixtures)).documentElement
+                parallel_fixtures = [{'model': node.getAttribute('model'), 'pk': int(node.getAttribute('pk'))}
+                                     for node in root.childNodes if node.nodeName == 'object']
+            self.assertEqual(sorted((fixture['model'], fixture['pk']) for fixture in parallel_fixtures),
+                             fixtures_keys)
+        # With one shard, the same fixtures as serialize_many
+        for indent in (None, 2):
+            fixtures = serializer_many('xml', websites,
+                                       walking_classes=walking_classes,
+                                       natural_keys=False,
+                                       read_only=True,
+                                       indent=indent)
+            parallel_fixtures = serializer_parallel('xml', websites,
+                                                    max_workers=1,
+                                                    num_shards=1,
+                                                    walking_classes=walking_classes,
+                                                    natural_keys=False,
+                                                    read_only=True,
+                                                    indent=indent)
+            self.assertEqual(minidom.parseString(smart_bytes(parallel_fixtures)).toxml(),
+                             minidom.parseString(smart_bytes(fixtures)).toxml())
@@ -16,32 +16,32 @@
 
 from django.contrib.auth.models import User
 
-from deep_serializer import serializer, deserializer, BaseMetaWalkClass
+from deep_serializer import serializer, deserializer, compile_walk_plan, BaseMetaWalkClass
 
 from example.app.models import WebSite, Page
 from example.app.serializer import (WebSiteClone, WebSiteOwnersClone, WebSiteRestore, WebSiteRestoreNaturalKey,
                                     PageClone, PageOwnersClone, PageCloneFiltering, PageRestore, PageRestoreNaturalKey,
                                     UserClone)
 
-walking_clone_classes = {WebSite: WebSiteClone,
-                         Page: PageClone,
-                         User: BaseMetaWalkClass}
+walking_clone_classes = compile_walk_plan({WebSite: WebSiteClone,
+                                           Page: PageClone,
+                                           User: BaseMetaWalkClass})
 
-walking_clone_owners_classes = {WebSite: WebSiteOwnersClone,
-                                Page: PageOwnersClone,
-                                User: UserClone}
+walking_clone_owners_classes = compile_walk_plan({WebSite: WebSiteOwnersClone,
+                                                  Page: PageOwnersClone,
+                                                  User: UserClone})
 
-walking_filtering_classes = {WebSite: WebSiteClone,
-                             Page: PageCloneFiltering,
-                             User: BaseMetaWalkClass}
+walking_filtering_classes = compile_walk_plan({WebSite: WebSiteClone,
+                                               Page: PageCloneFiltering,
+                                               User: BaseMetaWalkClass})
 
-walking_restore_classes = {WebSite: WebSiteRestore,
-                           Page: PageRestore,
-                           User: BaseMetaWalkClass}
+walking_restore_classes = compile_walk_plan({WebSite: WebSiteRestore,
+                                             Page: PageRestore,
+                                             User: BaseMetaWalkClass})
 
-walking_restore_classes_natural = {WebSite: WebSiteRestoreNaturalKey,
-                                   Page: PageRestoreNaturalKey,
-                                   User: BaseMetaWalkClass}
+walking_restore_classes_natural = compile_walk_plan({WebSite: WebSiteRestoreNaturalKey,
+                                                     Page: PageRestoreNaturalKey,
+                                                     User: BaseMetaWalkClass})
 
 
 def get_params_to_serialize_deserialize(action):
@@ -63,7 +63,7 @@ def get_params_to_serialize_deserialize(action):
     return (walking_classes, natural_keys)
 
 
-def serialize_website(website, action='clone', format='json', serialize_options=None):
+def serialize_website(website, action='clone', format='json', serialize_options=None, batched=False):
     walking_classes, natural_keys = get_params_to_serialize_deserialize(action)
     return serializer(format,
                       website,
@@ -71,7 +71,8 @@ def serialize_website(website, action='clone', format='json', serialize_options=
                       natural_keys=natural_keys,
                       can_get_objs_from_several_path=action == 'clone-with-owners',
                       serialize_options=serialize_options,
-                      request=None)
+                      request=None,
+                      batched=batched)
 
 
 def deserialize_website(website, fixtures, action='clone', format='json'):
@@ -84,6 +85,6 @@ def deserialize_website(website, fixtures, action='clone', format='json'):
                         pretreatment_fixtures=action == 'clone-filtering-objects')
 
 
-def clone_website(website, action='clone', format='json'):
-    fixtures = serialize_website(website, action=action, format=format)
+def clone_website(website, action='clone', format='json', batched=False):
+    fixtures = serialize_website(website, action=action, format=format, batched=batched)
     return deserialize_website(website, fixtures, action=action, format=format)